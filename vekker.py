@@ -1,873 +1,347 @@
-import wx
-import wx.lib.newevent
-import pygame
+import time
 import datetime
 import threading
-import time
 import json
+import queue
 import os
 import sys
 import logging
-import copy
-import wx.adv
-import wx.lib.stattext # Statikus szöveg
-
-# Google Drive API importok, ha szükségesek (csak akkor, ha a felhasználó telepítette őket)
-try:
-    from google.auth.transport.requests import Request
-    from google.oauth2.credentials import Credentials
-    from google_auth_oauthlib.flow import InstalledAppFlow
-    from googleapiclient.discovery import build
-    from googleapiclient.http import MediaFileUpload, MediaIoBaseDownload
-    from io import FileIO
-    DRIVE_API_AVAILABLE = True
-except ImportError:
-    logging.warning("Google Drive API modulok nem találhatók. A Google Drive funkciók nem lesznek elérhetők.")
-    DRIVE_API_AVAILABLE = False
-
-
-# --- Logger beállítása ---
-log_file_path = 'vekker_log.txt'
-# Gyökér logger beállítása
-logging.basicConfig(level=logging.INFO,
-                    format='%(asctime)s - %(levelname)s - %(message)s',
-                    handlers=[
-                        logging.FileHandler(log_file_path, encoding='utf-8'),
-                        logging.StreamHandler(sys.stdout)
-                    ])
-
-# --- Google Drive API konfiguráció ---
-SCOPES = ['https://www.googleapis.com/auth/drive.file']
-CREDENTIALS_FILE = 'credentials.json'
-TOKEN_FILE = 'token.json'
-DRIVE_FOLDER_NAME = 'Vekker_Backups'
-SCHEDULE_FILE = 'csengetesi_rend.json'
-SETTINGS_FILE = 'vekker_settings.json'
-
-
-
-# ==================== AdaptiveVoiceDuckerVAD (WebRTC alapú) ====================
-import pyaudio
-import numpy as np
-import webrtcvad
-import logging
-import threading
-import time
-from ctypes import cast, POINTER
-from comtypes import CLSCTX_ALL
-from pycaw.pycaw import AudioUtilities, IAudioEndpointVolume
-
-class AdaptiveVoiceDuckerVAD:
-    def __init__(self,
-                 min_volume=0.15,
-                 max_volume=1.0,
-                 attack=0.35,
-                 release=0.96,
-                 check_interval=0.04,
-                 vad_level=2):
-
-        self.min_volume = min_volume
-        self.max_volume = max_volume
-        self.attack = attack
-        self.release = release
-        self.check_interval = check_interval
-        self.running = False
-
-        devices = AudioUtilities.GetSpeakers()
-        interface = devices.Activate(IAudioEndpointVolume._iid_, CLSCTX_ALL, None)
-        self.volume = cast(interface, POINTER(IAudioEndpointVolume))
-
-        try:
-            self.original_volume = float(self.volume.GetMasterVolumeLevelScalar())
-        except Exception:
-            logging.exception("Nem sikerült beolvasni az eredeti hangerőt, 1.0-t használunk.")
-            self.original_volume = 1.0
-        self.current_volume = self.original_volume
-
-        self.audio = pyaudio.PyAudio()
-        self.stream = self.audio.open(format=pyaudio.paInt16,
-                                      channels=1,
-                                      rate=16000,
-                                      input=True,
-                                      frames_per_buffer=320)  # 20ms @16kHz
-
-        self.vad = webrtcvad.Vad(vad_level)
-
-        logging.info(f"AdaptiveVoiceDuckerVAD inicializálva. original_volume={self.original_volume:.2f}")
-
-    def _is_speech(self, frame: bytes) -> bool:
-        try:
-            return self.vad.is_speech(frame, 16000)
-        except Exception:
-            return False
-
-    def _compute_target_volume(self, speech_detected: bool) -> float:
-        if not speech_detected:
-            return self.original_volume
-        return self.min_volume
-
-    def _smooth(self, current: float, target: float) -> float:
-        alpha = self.attack if target < current else self.release
-        return alpha * current + (1.0 - alpha) * target
-
-    def _set_volume_safe(self, level: float):
-        level = max(0.0, min(1.0, float(level)))
-        try:
-            self.volume.SetMasterVolumeLevelScalar(level, None)
-        except Exception:
-            logging.exception("Hangerő állítás hiba")
-
-    def start(self):
-        logging.info("AdaptiveVoiceDuckerVAD indul...")
-        self.running = True
-        threading.Thread(target=self._monitor, daemon=True).start()
-
-    def stop(self):
-        logging.info("AdaptiveVoiceDuckerVAD leáll, hangerő visszaállítva.")
-        self._set_volume_safe(self.original_volume)
-        self.running = False
-        try:
-            self.stream.stop_stream()
-            self.stream.close()
-        finally:
-            self.audio.terminate()
-
-    def _monitor(self):
-        logging.info("AdaptiveVoiceDuckerVAD szál elindult.")
-        while self.running:
-            try:
-                frame = self.stream.read(320, exception_on_overflow=False)
-            except Exception:
-                logging.exception("Mikrofon olvasási hiba")
-                time.sleep(0.1)
-                continue
-
-            speech = self._is_speech(frame)
-            target_volume = self._compute_target_volume(speech)
-            prev = self.current_volume
-            self.current_volume = self._smooth(self.current_volume, target_volume)
-            self._set_volume_safe(self.current_volume)
-            logging.debug(f"[DuckerVAD] speech={speech} target={target_volume:.2f} vol={self.current_volume:.2f} prev={prev:.2f}")
-            time.sleep(self.check_interval)
-        logging.info("AdaptiveVoiceDuckerVAD szál leállt.")
-# =================================================================
-
-# --- Segéd változók ---
-WEEKDAYS_HUNGARIAN = ["Hétfő", "Kedd", "Szerda", "Csütörtök", "Péntek", "Szombat", "Vasárnap"]
-
-# Egyedi esemény a hang lejátszás befejezéséhez
-BellFinishedPlayingEvent, EVT_BELL_FINISHED_PLAYING = wx.lib.newevent.NewEvent()
-# Egyedi esemény a Google Drive állapot frissítéséhez
-DriveStatusEvent, EVT_DRIVE_STATUS = wx.lib.newevent.NewEvent()
-# Egyedi esemény a csengetési lista frissítéséhez (pl. másolás után)
-ScheduleUpdatedEvent, EVT_SCHEDULE_UPDATED = wx.lib.newevent.NewEvent()
-
-
-class GoogleDriveManager:
-    def __init__(self, main_frame):
-        self.main_frame = main_frame
-        self.creds = None
-        self.service = None
-        self.lock = threading.Lock() # Zár a többszálas hozzáféréshez
-        self.last_backup_time = None
-        self.authenticated = False
-
-    def _update_status(self, message, authenticated=None, last_backup=None):
-        if authenticated is not None:
-            self.authenticated = authenticated
-        if last_backup is not None:
-            self.last_backup_time = last_backup
-
-        event = DriveStatusEvent(message=message, authenticated=self.authenticated, last_backup_time=self.last_backup_time)
-        wx.PostEvent(self.main_frame, event)
-        logging.info(f"Google Drive állapot frissítve: {message}")
-
-    def _get_drive_service(self):
-        if not DRIVE_API_AVAILABLE:
-            self._update_status("Google Drive API modulok hiányoznak.", authenticated=False)
-            return None
-
-        with self.lock: # Zár biztosítja a szálbiztos hozzáférést a creds-hez és service-hez
-            if self.creds and self.creds.valid and self.service:
-                return self.service
-
-            if os.path.exists(TOKEN_FILE):
-                try:
-                    self.creds = Credentials.from_authorized_user_file(TOKEN_FILE, SCOPES)
-                except Exception as e:
-                    logging.error(f"Hiba a tokenfájl betöltésekor: {e}")
-                    self.creds = None
-
-            if not self.creds or not self.creds.valid:
-                if self.creds and self.creds.expired and self.creds.refresh_token:
-                    try:
-                        self.creds.refresh(Request())
-                    except Exception as e:
-                        logging.error(f"Hiba a token frissítésekor: {e}")
-                        self.creds = None
-                else:
-                    try:
-                        flow = InstalledAppFlow.from_client_secrets_file(CREDENTIALS_FILE, SCOPES)
-                        self.creds = flow.run_local_server(port=0)
-                    except Exception as e:
-                        logging.error(f"Hiba a hitelesítés során: {e}")
-                        self.creds = None
-
-                if self.creds:
-                    try:
-                        with open(TOKEN_FILE, 'w') as token:
-                            token.write(self.creds.to_json())
-                    except Exception as e:
-                        logging.error(f"Hiba a token mentésekor: {e}")
-
-            if self.creds:
-                self.service = build('drive', 'v3', credentials=self.creds)
-                self.authenticated = True
-                self._update_status("Sikeresen bejelentkezve.", authenticated=True)
-                return self.service
-
-            self.authenticated = False
-            self._update_status("Nincs bejelentkezve.", authenticated=False)
-            return None
-
-    def authenticate_google_drive(self):
-        logging.info("Google Drive hitelesítés indítása...")
-        self._update_status("Hitelesítés folyamatban...", authenticated=False)
-        threading.Thread(target=self._authenticate_thread, daemon=True).start()
-
-    def _authenticate_thread(self):
-        service = self._get_drive_service()
-        if service:
-            self._update_status("Sikeresen bejelentkezve.", authenticated=True)
-            logging.info("Google Drive hitelesítés sikeres.")
-        else:
-            self._update_status("Hitelesítés sikertelen.", authenticated=False)
-            logging.error("Google Drive hitelesítés sikertelen.")
-
-    def sign_out_google_drive(self):
-        if not DRIVE_API_AVAILABLE:
-            self._update_status("Google Drive API modulok hiányoznak.", authenticated=False)
-            return
-
-        with self.lock:
-            self.creds = None
-            self.service = None
-            if os.path.exists(TOKEN_FILE):
-                os.remove(TOKEN_FILE)
-            self.authenticated = False
-            self.last_backup_time = None
-            self._update_status("Kijelentkezve.", authenticated=False, last_backup=None)
-            logging.info("Google Drive kijelentkezés sikeres.")
-
-    def _find_or_create_folder(self, service):
-        # Keresés meglévő mappa után
-        query = f"name='{DRIVE_FOLDER_NAME}' and mimeType='application/vnd.google-apps.folder' and trashed=false"
-        response = service.files().list(q=query, spaces='drive', fields='files(id, name)').execute()
-        files = response.get('files', [])
-        if files:
-            logging.info(f"Meglévő Google Drive mappa található: {files[0]['name']} (ID: {files[0]['id']})")
-            return files[0]['id']
-        else:
-            # Ha nem található, létrehozás
-            file_metadata = {
-                'name': DRIVE_FOLDER_NAME,
-                'mimeType': 'application/vnd.google-apps.folder'
-            }
-            folder = service.files().create(body=file_metadata, fields='id').execute()
-            logging.info(f"Google Drive mappa létrehozva: {DRIVE_FOLDER_NAME} (ID: {folder.get('id')})")
-            return folder.get('id')
-
-    def list_drive_files(self):
-        if not self.authenticated:
-            self.authenticate_google_drive() # Megpróbáljuk hitelesíteni, ha nincs bejelentkezve
-            return # A listázás a hitelesítés után fog lefutni
-
-        logging.info("Google Drive fájlok listázása indult...")
-        self._update_status("Fájlok lekérése...", authenticated=True)
-        threading.Thread(target=self._list_drive_files_thread, daemon=True).start()
-
-    def _list_drive_files_thread(self):
-        service = self._get_drive_service()
-        if not service:
-            self._update_status("Nincs bejelentkezve.", authenticated=False)
-            return
-
-        try:
-            folder_id = self._find_or_create_folder(service)
-            if not folder_id:
-                self._update_status("Mappa létrehozása/keresése sikertelen.", authenticated=True)
-                return
-
-            query = f"'{folder_id}' in parents and trashed=false"
-            response = service.files().list(q=query, spaces='drive', fields='files(id, name, modifiedTime, size)').execute()
-            files = response.get('files', [])
-            logging.info(f"Google Drive fájlok lekérve. Találatok: {len(files)}")
-            self._update_status(f"Fájlok lekérve. ({len(files)} találat)", authenticated=True)
-            wx.CallAfter(self.main_frame.settings_panel.update_drive_file_list, files)
-
-        except Exception as e:
-            logging.error(f"Hiba a Google Drive fájlok listázásakor: {e}")
-            self._update_status(f"Hiba a fájlok listázásakor: {e}", authenticated=True)
-
-    def upload_file_to_drive(self, local_file_path):
-        if not self.authenticated:
-            logging.warning("Nincs bejelentkezve a Google Drive-ba. Fájl feltöltés sikertelen.")
-            self._update_status("Nincs bejelentkezve.", authenticated=False)
-            return
-
-        logging.info(f"Fájl feltöltése Google Drive-ra indult: {local_file_path}")
-        self._update_status(f"Feltöltés folyamatban: {os.path.basename(local_file_path)}...", authenticated=True)
-        threading.Thread(target=self._upload_file_to_drive_thread, args=(local_file_path,), daemon=True).start()
-
-    def _upload_file_to_drive_thread(self, local_file_path):
-        service = self._get_drive_service()
-        if not service:
-            self._update_status("Nincs bejelentkezve.", authenticated=False)
-            return
-
-        try:
-            folder_id = self._find_or_create_folder(service)
-            if not folder_id:
-                self._update_status("Mappa létrehozása/keresése sikertelen.", authenticated=True)
-                return
-
-            file_name = os.path.basename(local_file_path)
-
-            # Ellenőrizzük, hogy létezik-e már ilyen nevű fájl a mappában
-            query = f"name='{file_name}' and '{folder_id}' in parents and trashed=false"
-            response = service.files().list(q=query, spaces='drive', fields='files(id)').execute()
-            existing_files = response.get('files', [])
-
-            file_metadata = {
-                'name': file_name,
-                'parents': [folder_id]
-            }
-            media = MediaFileUpload(local_file_path, resumable=True)
-
-            if existing_files:
-                # Frissítjük a meglévő fájlt
-                file_id = existing_files[0]['id']
-                service.files().update(fileId=file_id, media_body=media).execute()
-                logging.info(f"Google Drive fájl frissítve: {file_name}")
-                self._update_status(f"Fájl frissítve: {file_name}", authenticated=True, last_backup=datetime.datetime.now())
-            else:
-                # Létrehozzuk az új fájlt
-                service.files().create(body=file_metadata, media_body=media, fields='id').execute()
-                logging.info(f"Google Drive fájl feltöltve: {file_name}")
-                self._update_status(f"Fájl feltöltve: {file_name}", authenticated=True, last_backup=datetime.datetime.now())
-
-        except Exception as e:
-            logging.error(f"Hiba a Google Drive feltöltés során: {e}")
-            self._update_status(f"Feltöltési hiba: {e}", authenticated=True)
-
-    def download_file_from_drive(self, file_id, file_name, local_path):
-        if not self.authenticated:
-            logging.warning("Nincs bejelentkezve a Google Drive-ba. Fájl letöltés sikertelen.")
-            self._update_status("Nincs bejelentkezve.", authenticated=False)
-            return
-
-        logging.info(f"Fájl letöltése Google Drive-ról indult: {file_name} (ID: {file_id})")
-        self._update_status(f"Letöltés folyamatban: {file_name}...", authenticated=True)
-        threading.Thread(target=self._download_file_from_drive_thread, args=(file_id, file_name, local_path), daemon=True).start()
-
-    def _download_file_from_drive_thread(self, file_id, file_name, local_path):
-        service = self._get_drive_service()
-        if not service:
-            self._update_status("Nincs bejelentkezve.", authenticated=False)
-            return
-
-        try:
-            request = service.files().get_media(fileId=file_id)
-            with open(local_path, 'wb') as fh:
-                downloader = MediaIoBaseDownload(fh, request)
-                done = False
-                while done is False:
-                    status, done = downloader.next_chunk()
-            logging.info(f"Google Drive fájl letöltve: {local_path}")
-            self._update_status(f"Fájl letöltve: {file_name}", authenticated=True)
-            # Sikeres letöltés után töltse be a schedule-t vagy settings-t
-            if file_name == SCHEDULE_FILE:
-                wx.CallAfter(self.main_frame.load_bell_schedule)
-            elif file_name == SETTINGS_FILE:
-                wx.CallAfter(self.main_frame.load_settings)
-        except Exception as e:
-            logging.error(f"Hiba a Google Drive letöltés során: {e}")
-            self._update_status(f"Letöltési hiba: {e}", authenticated=True)
-
-class SettingsManager:
-    def __init__(self, main_frame):
-        self.main_frame = main_frame
-        self.settings_file = SETTINGS_FILE
-        self.settings = self.load_settings()
-
-    def load_settings(self):
-        if os.path.exists(self.settings_file):
-            try:
-                with open(self.settings_file, 'r', encoding='utf-8') as f:
-                    settings = json.load(f)
-                    logging.info("Beállítások betöltve.")
-                    return settings
-            except Exception as e:
-                logging.error(f"Hiba a beállítások betöltésekor: {e}")
-        # Alapértelmezett értékek
-        return {
-            'volume': 50,
-            'check_interval': 5.0,
-            'ducking_enabled': False # Új beállítás
-        }
-
-    def save_settings(self):
-        try:
-            with open(self.settings_file, 'w', encoding='utf-8') as f:
-                json.dump(self.settings, f, indent=4)
-            logging.info("Beállítások elmentve.")
-            self.main_frame.show_status_message("Beállítások elmentve.")
-            # Feltöltés Google Drive-ra is, ha be van jelentkezve
-            if self.main_frame.drive_manager.authenticated:
-                self.main_frame.drive_manager.upload_file_to_drive(self.settings_file)
-        except Exception as e:
-            logging.error(f"Hiba a beállítások mentésekor: {e}")
-            self.main_frame.show_status_message(f"Hiba a beállítások mentésekor: {e}")
-
-    def get_setting(self, key, default=None):
-        return self.settings.get(key, default)
-
-    def set_setting(self, key, value):
-        self.settings[key] = value
-        self.save_settings()
-
-class BellScheduleManager:
-    def __init__(self, main_frame):
-        self.main_frame = main_frame
-        self.schedule_file = SCHEDULE_FILE
-        self.bell_schedule = self.load_bell_schedule()
-
-    def load_bell_schedule(self):
-        if os.path.exists(self.schedule_file):
-            try:
-                with open(self.schedule_file, 'r', encoding='utf-8') as f:
-                    schedule = json.load(f)
-                    logging.info("Ütemezés betöltve: csengetesi_rend.json")
-                    self.main_frame.show_status_message("Ütemezés betöltve: csengetesi_rend.json")
-                    return schedule
-            except Exception as e:
-                logging.error(f"Hiba az csengetési rend betöltésekor: {e}")
-        logging.info("Nincs meglévő csengetési rend fájl, üres lista indul.")
-        return []
-
-    def save_bell_schedule(self):
-        try:
-            # Rendezzük az csengetéseket idő szerint mentés előtt
-            self.bell_schedule.sort(key=lambda x: datetime.datetime.strptime(x['time'], "%H:%M").time())
-            with open(self.schedule_file, 'w', encoding='utf-8') as f:
-                json.dump(self.bell_schedule, f, indent=4)
-            logging.info("Csengetési rend elmentve.")
-            self.main_frame.show_status_message("Csengetési rend elmentve.")
-            # Feltöltés Google Drive-ra is, ha be van jelentkezve
-            if self.main_frame.drive_manager.authenticated:
-                self.main_frame.drive_manager.upload_file_to_drive(self.schedule_file)
-        except Exception as e:
-            logging.error(f"Hiba az csengetési rend mentésekor: {e}")
-            self.main_frame.show_status_message(f"Hiba az csengetési rend mentésekor: {e}")
-
-    def add_bell(self, bell_data):
-        self.bell_schedule.append(bell_data)
-        logging.info(f"Új csengetés hozzáadva: {bell_data['time']}")
-        self.save_bell_schedule()
-
-    def update_bell(self, index, new_bell_data):
-        if 0 <= index < len(self.bell_schedule):
-            self.bell_schedule[index] = new_bell_data
-            logging.info(f"Csengetés frissítve (index: {index}): {new_bell_data['time']}")
-            self.save_bell_schedule()
-            return True
-        return False
-
-    def delete_bell(self, index):
-        if 0 <= index < len(self.bell_schedule):
-            deleted_bell = self.bell_schedule.pop(index)
-            logging.info(f"Csengetés törölve (index: {index}): {deleted_bell['time']}")
-            self.save_bell_schedule()
-            return True
-        return False
-
-    def get_bell_by_index(self, index):
-        if 0 <= index < len(self.bell_schedule):
-            return copy.deepcopy(self.bell_schedule[index])
-        return None
-
-    def get_bells_for_day(self, day):
-        # Ha "Összes nap" van kiválasztva, visszaadjuk az összes csengetést
-        if day == "Összes nap":
-            return self.bell_schedule
-        return [bell for bell in self.bell_schedule if day in bell.get('weekdays', [])]
-
-    def copy_bells_to_days(self, source_day, destination_days):
-        if source_day not in WEEKDAYS_HUNGARIAN:
-            logging.error(f"Érvénytelen forrás nap: {source_day}")
-            return
-
-        bells_to_copy = self.get_bells_for_day(source_day)
-        added_count = 0
-        skipped_count = 0
-
-        for dest_day in destination_days:
-            if dest_day not in WEEKDAYS_HUNGARIAN:
-                logging.warning(f"Érvénytelen cél nap kihagyva: {dest_day}")
-                continue
-            if dest_day == source_day:
-                logging.info(f"Forrás és cél nap megegyezik ({dest_day}), kihagyva a másolást ide.")
-                continue
-
-            for bell in bells_to_copy:
-                # Létrehozunk egy mély másolatot az csengetésről
-                new_bell = copy.deepcopy(bell)
-
-                # Frissítjük a napokat az új napra
-                new_bell['weekdays'] = [dest_day]
-
-                # Ellenőrizzük, hogy létezik-e már pontosan ilyen csengetés a cél napon
-                # (idő, hangfájl és név egyezik az adott napra)
-                already_exists = False
-                for existing_bell in self.get_bells_for_day(dest_day):
-                    if (existing_bell['time'] == new_bell['time'] and
-                        existing_bell.get('name') == new_bell.get('name') and
-                        existing_bell.get('sound_file') == new_bell.get('sound_file')):
-                        already_exists = True
-                        break
-
-                if not already_exists:
-                    self.bell_schedule.append(new_bell)
-                    added_count += 1
-                    logging.info(f"Csengetés másolva: {new_bell['time']} - {new_bell.get('name')} ide: {dest_day}")
-                else:
-                    skipped_count += 1
-                    logging.info(f"Duplikátum csengetés kihagyva: {new_bell['time']} - {new_bell.get('name')} ide: {dest_day}")
-
-        if added_count > 0:
-            self.save_bell_schedule()
-            wx.PostEvent(self.main_frame, ScheduleUpdatedEvent()) # Frissítjük a UI-t
-            self.main_frame.show_status_message(f"{added_count} csengetés másolva. {skipped_count} kihagyva.")
-            logging.info(f"Sikeresen másolva {added_count} csengetés, {skipped_count} duplikátum kihagyva.")
-        else:
-            self.main_frame.show_status_message("Nincs új csengetés másolva.")
-            logging.info("Nincs új csengetés másolva.")
-
-
-class BellPlayer:
-    def __init__(self, main_frame):
-        self.main_frame = main_frame
-        self.is_playing = False
-        self.stop_requested = False
-        self.current_sound_file = None
-        self.player_thread = None
-
-        try:
-            pygame.mixer.init()
-            logging.info("Pygame mixer inicializálva.")
-        except Exception as e:
-            logging.error(f"Hiba a Pygame mixer inicializálásakor: {e}")
-
-    def play_sound(self, sound_file, volume):
-        if not pygame.mixer.get_init():
-            logging.error("Pygame mixer nincs inicializálva. A hang lejátszása sikertelen.")
-            self.main_frame.show_status_message("Hiba: Hang lejátszás nem lehetséges (mixer hiba).")
-            return
-
-        if self.is_playing:
-            self.stop_sound()
-            time.sleep(0.1) # Várjunk egy kicsit, hogy a stop végrehajtódjon
-
-        self.stop_requested = False
-        self.current_sound_file = sound_file
-
-        self.player_thread = threading.Thread(target=self._play_sound_thread, args=(sound_file, volume), daemon=True)
-        self.player_thread.start()
-
-    def _play_sound_thread(self, sound_file, volume):
-        if not os.path.exists(sound_file):
-            logging.error(f"A hangfájl nem található: {sound_file}")
-            wx.CallAfter(self.main_frame.show_status_message, f"Hiba: A hangfájl nem található: {os.path.basename(sound_file)}")
-            self.is_playing = False
-            return
-
-        try:
-            pygame.mixer.music.load(sound_file)
-            pygame.mixer.music.set_volume(volume / 100.0)
-            pygame.mixer.music.play()
-            self.is_playing = True
-            logging.info(f"Hang lejátszása indult: {sound_file}, hangerő: {volume}")
-            wx.CallAfter(self.main_frame.show_status_message, f"Csengetés szól: {os.path.basename(sound_file)}")
-
-            while pygame.mixer.music.get_busy() and not self.stop_requested:
-                time.sleep(0.1)
-
-            pygame.mixer.music.stop()
-            pygame.mixer.music.unload()
-            self.is_playing = False
-            self.current_sound_file = None
-            logging.info("Hang lejátszás befejeződött.")
-            wx.CallAfter(self.main_frame.show_status_message, "Csengetés befejeződött.")
-            wx.PostEvent(self.main_frame, BellFinishedPlayingEvent())
+import array
+import bisect
+import collections
+import hashlib
+import importlib
+import importlib.util
+import mmap
+import wave
+import socket
+import types
+
+# --- Indítási idő mérése ---
+STARTUP_STARTED = time.perf_counter()
+IMPORT_TIMES = {} # alrendszer -> betöltési idő (mp)
+
+
+def record_import_time(subsystem, seconds):
+    IMPORT_TIMES[subsystem] = round(seconds, 4)
+    logging.info(f"Alrendszer betöltve: {subsystem} ({seconds * 1000:.0f} ms)")
+
+
+class LazyModule:
+    # Nehéz, opcionális modul, amely csak az első attribútum eléréskor töltődik be; a betöltési időt rögzítjük
+    def __init__(self, name, subsystem=None):
+        self._name = name
+        self._subsystem = subsystem or name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            started = time.perf_counter()
+            module = importlib.import_module(self._name)
+            record_import_time(self._subsystem, time.perf_counter() - started)
+            self._module = module
+        return self._module
+
+    def __getattr__(self, attribute):
+        return getattr(self._load(), attribute)
+
+
+_import_started = time.perf_counter()
+import wx
+import wx.lib.newevent
+import wx.adv
+import wx.lib.stattext # Statikus szöveg
+IMPORT_TIMES['wx'] = round(time.perf_counter() - _import_started, 4)
+_import_started = time.perf_counter()
+import pygame
+IMPORT_TIMES['pygame'] = round(time.perf_counter() - _import_started, 4)
 
-        except pygame.error as e:
-            logging.error(f"Hiba a Pygame hang lejátszásakor: {e}")
-            wx.CallAfter(self.main_frame.show_status_message, f"Hiba a hang lejátszásakor: {e}")
-            self.is_playing = False
-        except Exception as e:
-            logging.error(f"Ismeretlen hiba a hang lejátszásakor: {e}")
-            wx.CallAfter(self.main_frame.show_status_message, f"Ismeretlen hiba a hang lejátszásakor: {e}")
-            self.is_playing = False
-
-
-    def stop_sound(self):
-        if self.is_playing:
-            self.stop_requested = True
-            logging.info("Hang lejátszás leállítási kérelem elküldve.")
-            # Nem hívjuk meg itt a stop() és unload() fv-t,
-            # mert a lejátszó szál felelős ezek végrehajtásáért.
-            # Ehelyett várunk, hogy a szál befejeződjön.
-            if self.player_thread and self.player_thread.is_alive():
-                self.player_thread.join(timeout=1) # Max 1 mp-et várunk
-                if self.player_thread.is_alive():
-                    logging.warning("Lejátszó szál nem állt le időben.")
-            self.is_playing = False
-            self.current_sound_file = None
-            logging.info("Hang lejátszás leállítva.")
-            wx.CallAfter(self.main_frame.show_status_message, "Csengetés leállítva.")
+# --- Logger beállítása ---
+log_file_path = 'vekker_log.txt'
+# Gyökér logger beállítása
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(levelname)s - %(message)s',
+                    handlers=[
+                        logging.FileHandler(log_file_path, encoding='utf-8'),
+                        logging.StreamHandler(sys.stdout)
+                    ])
 
-class BellChecker:
-    def __init__(self, main_frame, bell_player, bell_schedule_manager, settings_manager):
-        self.main_frame = main_frame
-        self.bell_player = bell_player
-        self.bell_schedule_manager = bell_schedule_manager
-        self.settings_manager = settings_manager
-        self.timer = wx.Timer(main_frame)
-        self.check_interval = self.settings_manager.get_setting('check_interval', 5.0)
-        self.is_running = False
-        self.thread = None
-        self.stop_event = threading.Event()
+# Google Drive API: csak azt nézzük meg, hogy telepítve van-e; a lassú betöltés az első Drive műveletkor történik
+DRIVE_API_AVAILABLE = all(importlib.util.find_spec(name) is not None
+                          for name in ('googleapiclient', 'google_auth_oauthlib', 'google.oauth2'))
+if not DRIVE_API_AVAILABLE:
+    logging.warning("Google Drive API modulok nem találhatók. A Google Drive funkciók nem lesznek elérhetők.")
 
-    def start_checking(self):
-        if self.is_running:
-            return
 
-        self.stop_event.clear()
-        self.thread = threading.Thread(target=self._check_bells_thread, daemon=True)
-        self.thread.start()
-        self.is_running = True
-        logging.info(f"Időzítő elindítva, ellenőrzési intervallum: {self.check_interval} másodperc.")
-        logging.info("Ébresztő ellenőrző szál elindítva.")
+def load_drive_api():
+    global Request, Credentials, InstalledAppFlow, build, MediaFileUpload, MediaIoBaseDownload, FileIO
+    if 'google_drive' in IMPORT_TIMES:
+        return
+    started = time.perf_counter()
+    from google.auth.transport.requests import Request
+    from google.oauth2.credentials import Credentials
+    from google_auth_oauthlib.flow import InstalledAppFlow
+    from googleapiclient.discovery import build
+    from googleapiclient.http import MediaFileUpload, MediaIoBaseDownload
+    from io import FileIO
+    record_import_time('google_drive', time.perf_counter() - started)
 
-    def stop_checking(self):
-        if not self.is_running:
-            return
+# --- Google Drive API konfiguráció ---
+SCOPES = ['https://www.googleapis.com/auth/drive.file']
+CREDENTIALS_FILE = 'credentials.json'
+TOKEN_FILE = 'token.json'
+DRIVE_FOLDER_NAME = 'Vekker_Backups'
+SCHEDULE_FILE = 'csengetesi_rend.json'
+SETTINGS_FILE = 'vekker_settings.json'
+ALARM_PORT = 50777 # Vészjelzés parancsfogadó (csak localhost)
+FIRE_LEDGER_FILE = 'vekker_fire_ledger.json'
+LOUDNESS_CACHE_FILE = 'vekker_loudness.json'
+PCM_CACHE_DIR = 'hangok_cache'
 
-        self.stop_event.set()
-        logging.info("Ébresztő ellenőrző szál leállítási kérelem elküldve.")
-        if self.thread and self.thread.is_alive():
-            self.thread.join(timeout=self.check_interval + 1) # Várjuk meg a szál leállását
-            if self.thread.is_alive():
-                logging.warning("Ébresztő ellenőrző szál nem állt le időben.")
-        self.is_running = False
-        logging.info("Ébresztő ellenőrző szál leállítva.")
 
 
-    def _check_bells_thread(self):
-        while not self.stop_event.is_set():
-            now = datetime.datetime.now()
-            current_time_str = now.strftime("%H:%M")
-            current_weekday_index = now.weekday() # Hétfő=0, Vasárnap=6
-
-            # Frissítsük a bell_schedule-t minden ellenőrzés előtt,
-            # ha változott a fájl vagy a memória
-            bell_schedule_copy = copy.deepcopy(self.bell_schedule_manager.bell_schedule)
-
-            for bell in bell_schedule_copy:
-                bell_time = bell['time']
-                bell_weekdays = bell.get('weekdays', [])
-                bell_name = bell.get('name', 'Névtelen csengetés')
-                bell_sound_file = bell.get('sound_file')
-                bell_volume = bell.get('volume', 50)
-                bell_enabled = bell.get('enabled', True) # Alapértelmezett, hogy engedélyezve van
-
-                if not bell_enabled:
-                    continue # Kihagyjuk a letiltott csengetéseket
-
-                # Ellenőrizzük a napokat
-                if bell_weekdays and WEEKDAYS_HUNGARIAN[current_weekday_index] not in bell_weekdays:
-                    continue
+# ==================== AdaptiveVoiceDuckerVAD (WebRTC alapú) ====================
+import re
+import shutil
+import subprocess
+import multiprocessing
+# A hangfeldolgozó modulok csak az első használatkor (ducking bekapcsolása, hangelemzés) töltődnek be
+pyaudio = LazyModule('pyaudio')
+np = LazyModule('numpy')
+webrtcvad = LazyModule('webrtcvad')
+# A pycaw csak Windowson érhető el; nélküle más hangerő vezérlő (VolumeBackend) használható
+PYCAW_AVAILABLE = all(importlib.util.find_spec(name) is not None for name in ('pycaw', 'comtypes'))
+
+
+def load_pycaw():
+    global cast, POINTER, CLSCTX_ALL, AudioUtilities, IAudioEndpointVolume
+    if 'pycaw' in IMPORT_TIMES:
+        return
+    started = time.perf_counter()
+    from ctypes import cast, POINTER
+    from comtypes import CLSCTX_ALL
+    from pycaw.pycaw import AudioUtilities, IAudioEndpointVolume
+    record_import_time('pycaw', time.perf_counter() - started)
+
+VAD_SAMPLE_RATE = 16000
+VAD_FRAME_SAMPLES = 320 # 20ms @16kHz
+VAD_FRAME_SECONDS = VAD_FRAME_SAMPLES / VAD_SAMPLE_RATE
+STATS_LOG_FRAMES = 45000 # 15 percenként naplózzuk a keret statisztikát
+# Az osztott állapot mezői (double tömb): simított hangerő szint, beszéd (0/1), feldolgozott keretek
+DUCKER_STATE_LEVEL = 0
+DUCKER_STATE_SPEECH = 1
+DUCKER_STATE_FRAMES = 2
+DUCKER_STATE_SIZE = 3
+
+class VolumeBackend:
+    # A rendszer (végpont) hangerő vezérlés felülete a duckerhez; a szint 0.0-1.0
+    name = 'alap'
+
+    def get_volume(self) -> float:
+        raise NotImplementedError
+
+    def set_volume(self, level: float):
+        raise NotImplementedError
+
+
+class PycawVolumeBackend(VolumeBackend):
+    # Windows: az alapértelmezett hangszóró IAudioEndpointVolume felülete
+    name = 'pycaw'
+
+    def __init__(self):
+        if not PYCAW_AVAILABLE:
+            raise RuntimeError("A pycaw/comtypes modulok nem érhetők el.")
+        load_pycaw()
+        devices = AudioUtilities.GetSpeakers()
+        interface = devices.Activate(IAudioEndpointVolume._iid_, CLSCTX_ALL, None)
+        self.volume = cast(interface, POINTER(IAudioEndpointVolume))
 
-                if current_time_str == bell_time:
-                    logging.info(f"Ébresztő szól: {bell_name} - {bell_time}")
-                    if bell_sound_file:
-                        full_sound_path = os.path.join('hangok', bell_sound_file) # Teljes elérési út
-                        self.bell_player.play_sound(full_sound_path, bell_volume)
-                    else:
-                        wx.CallAfter(self.main_frame.show_status_message, f"Ébresztő szól: {bell_name} - {bell_time} (Nincs hangfájl beállítva)")
-                    # Hogy ne szólaljon meg újra azonnal:
-                    time.sleep(61) # Vár egy percet, mielőtt újra ellenőriz
+    def get_volume(self):
+        return float(self.volume.GetMasterVolumeLevelScalar())
 
-            self.stop_event.wait(self.check_interval) # Vár a beállított intervallumot, vagy amíg meg nem állítják
+    def set_volume(self, level):
+        self.volume.SetMasterVolumeLevelScalar(level, None)
 
-    def update_check_interval(self, new_interval):
-        self.check_interval = new_interval
-        if self.is_running:
-            self.stop_checking()
-            self.start_checking()
-        logging.info(f"Időzítő ellenőrzési intervallum frissítve: {new_interval} másodperc.")
 
+class CommandVolumeBackend(VolumeBackend):
+    # Linux: hangerő a hangkiszolgáló parancssori eszközével, a kimenetből az első százalék érték a szint
+    get_command = []
+    set_command = []
 
-class BellScheduleDialog(wx.Dialog):
-    def __init__(self, parent, bell_data=None, available_sounds=None):
-        super(BellScheduleDialog, self).__init__(parent, title="Csengetés hozzáadása", size=(400, 450))
+    def get_volume(self):
+        output = subprocess.run(self.get_command, capture_output=True, text=True, timeout=2, check=True).stdout
+        match = re.search(r'(\d+)%', output)
+        if match is None:
+            raise RuntimeError(f"Nem értelmezhető hangerő kimenet: {output.strip()}")
+        return int(match.group(1)) / 100.0
 
-        self.panel = wx.Panel(self)
-        self.bell_data = bell_data if bell_data else {}
-        self.available_sounds = available_sounds if available_sounds else []
+    def set_volume(self, level):
+        subprocess.run(self.set_command + [f"{round(level * 100)}%"], capture_output=True, timeout=2, check=True)
 
-        main_sizer = wx.BoxSizer(wx.VERTICAL)
 
-        # Idő
-        time_sizer = wx.BoxSizer(wx.HORIZONTAL)
-        time_sizer.Add(wx.StaticText(self.panel, label="Idő:"), 0, wx.ALIGN_CENTER_VERTICAL | wx.ALL, 5)
-        # Óra és perc kiválasztása külön legördülőkből
-        time_sizer = wx.BoxSizer(wx.HORIZONTAL)
-        time_sizer.Add(wx.StaticText(self.panel, label="Óra:"), 0, wx.ALIGN_CENTER_VERTICAL | wx.ALL, 5)
-        self.hour_choice = wx.Choice(self.panel, choices=[f"{h:02d}" for h in range(24)])
-        time_sizer.Add(self.hour_choice, 0, wx.ALL, 5)
-        time_sizer.Add(wx.StaticText(self.panel, label="Perc:"), 0, wx.ALIGN_CENTER_VERTICAL | wx.ALL, 5)
-        self.minute_choice = wx.Choice(self.panel, choices=[f"{m:02d}" for m in range(60)])
-        time_sizer.Add(self.minute_choice, 0, wx.ALL, 5)
-        main_sizer.Add(time_sizer, 0, wx.EXPAND | wx.ALL, 5)
+class PulseAudioVolumeBackend(CommandVolumeBackend):
+    name = 'pulseaudio'
+    get_command = ['pactl', 'get-sink-volume', '@DEFAULT_SINK@']
+    set_command = ['pactl', 'set-sink-volume', '@DEFAULT_SINK@']
 
-        # Név
 
-        # Hangerő
-        volume_sizer = wx.BoxSizer(wx.HORIZONTAL)
-        volume_sizer.Add(wx.StaticText(self.panel, label="Hangerő:"), 0, wx.ALIGN_CENTER_VERTICAL | wx.ALL, 5)
-        self.volume_slider = wx.Slider(self.panel, value=self.bell_data.get('volume', 50), minValue=0, maxValue=100,
-                                      style=wx.SL_HORIZONTAL | wx.SL_LABELS)
-        volume_sizer.Add(self.volume_slider, 1, wx.EXPAND | wx.ALL, 5)
-        main_sizer.Add(volume_sizer, 0, wx.EXPAND | wx.ALL, 5)
+class AlsaVolumeBackend(CommandVolumeBackend):
+    name = 'alsa'
+    get_command = ['amixer', 'sget', 'Master']
+    set_command = ['amixer', '-q', 'sset', 'Master']
 
-        # Hangfájl
-        sound_sizer = wx.BoxSizer(wx.HORIZONTAL)
-        sound_sizer.Add(wx.StaticText(self.panel, label="Hangfájl:"), 0, wx.ALIGN_CENTER_VERTICAL | wx.ALL, 5)
-        self.sound_choice = wx.Choice(self.panel, choices=self.available_sounds)
-        sound_sizer.Add(self.sound_choice, 1, wx.EXPAND | wx.ALL, 5)
-        test_sound_btn = wx.Button(self.panel, label="Teszt")
-        test_sound_btn.Bind(wx.EVT_BUTTON, self.on_test_sound)
-        sound_sizer.Add(test_sound_btn, 0, wx.ALIGN_CENTER_VERTICAL | wx.LEFT, 5)
-        main_sizer.Add(sound_sizer, 0, wx.EXPAND | wx.ALL, 5)
 
-        # Napok kiválasztása
-        days_label = wx.StaticText(self.panel, label="Napok:")
-        main_sizer.Add(days_label, 0, wx.ALL, 5)
+class MemoryVolumeBackend(VolumeBackend):
+    # Hangkártya nélküli gépekre és mérésekhez. record=True esetén a beállított szinteket időbélyeggel
+    # együtt rögzíti; ez egész napos élő futásnál korlát nélkül nőne, ezért alapból ki van kapcsolva.
+    name = 'memory'
 
-        grid_sizer = wx.GridSizer(4, 2, 5, 5) # 4 sor, 2 oszlop, 5px vert és horiz. távolság
-        self.day_checkboxes = {}
-        for day in WEEKDAYS_HUNGARIAN:
-            checkbox = wx.CheckBox(self.panel, label=day)
-            grid_sizer.Add(checkbox, 0, wx.EXPAND)
-            self.day_checkboxes[day] = checkbox
-        main_sizer.Add(grid_sizer, 1, wx.EXPAND | wx.ALL, 5)
+    def __init__(self, level=1.0, clock=time.monotonic, record=False):
+        self.level = level
+        self.clock = clock
+        self.history = [] if record else None # (időpont, szint)
 
-        # Gombok
-        button_sizer = wx.StdDialogButtonSizer()
-        ok_btn = wx.Button(self.panel, wx.ID_OK, label="Mentés") # Label hozzáadva
-        cancel_btn = wx.Button(self.panel, wx.ID_CANCEL)
-        button_sizer.AddButton(ok_btn)
-        button_sizer.AddButton(cancel_btn)
-        button_sizer.Realize()
+    def get_volume(self):
+        return self.level
 
-        main_sizer.Add(button_sizer, 0, wx.ALIGN_CENTER | wx.ALL, 10)
+    def set_volume(self, level):
+        self.level = level
+        if self.history is not None:
+            self.history.append((self.clock(), level))
 
-        self.panel.SetSizer(main_sizer)
-        self.panel.Layout() # Elrendezés frissítése
 
-        if bell_data:
-            self._load_bell_data(bell_data)
-        else:
-            if available_sounds:
-                self.sound_choice.SetSelection(0) # Válassza ki az első hangot alapértelmezettként
+class MixerVolumeBackend(VolumeBackend):
+    # A rendszer hangerő helyett csak a Vekker saját csatornáit halkítja (BellPlayer keverő szint).
+    # A csatorna hangerő a következő keverési pufferben érvényesül; összeomláskor nem marad halkított rendszer.
+    name = 'mixer'
 
+    def __init__(self, bell_player):
+        self.bell_player = bell_player
 
-    def _load_bell_data(self, bell_data):
-        time_obj = datetime.datetime.strptime(bell_data['time'], "%H:%M").time()
-        self.time_picker.SetValue(wx.DateTime.FromTime(time_obj.hour, time_obj.minute, 0))
+    def get_volume(self):
+        return self.bell_player.duck_gain
+
+    def set_volume(self, level):
+        self.bell_player.set_duck_gain(level)
+
+
+VOLUME_BACKENDS = {backend.name: backend for backend in
+                   (PycawVolumeBackend, PulseAudioVolumeBackend, AlsaVolumeBackend, MemoryVolumeBackend)}
+DUCKING_BACKEND_CHOICES = ['auto', MixerVolumeBackend.name] + list(VOLUME_BACKENDS)
+
+
+def create_volume_backend(name='auto'):
+    if name != 'auto':
+        return VOLUME_BACKENDS[name]()
+    if PYCAW_AVAILABLE:
+        return PycawVolumeBackend()
+    if shutil.which('pactl'):
+        return PulseAudioVolumeBackend()
+    if shutil.which('amixer'):
+        return AlsaVolumeBackend()
+    logging.warning("Nincs elérhető rendszer hangerő vezérlés, a ducker csak memóriában állítja a hangerőt.")
+    return MemoryVolumeBackend()
+
+
+class VolumeWriter:
+    # A végpont hangerő írása külön szálon: az újabb kérés felülírja a még ki nem írtat, a holtsávon belüli
+    # változás elmarad, és két írás között legalább min_interval telik el. A lassú COM hívás így nem tartja fel a kereteket.
+    def __init__(self, write_fn, deadband=0.01, min_interval=0.04, clock=time.monotonic, synchronous=False):
+        self.write_fn = write_fn
+        self.clock = clock
+        self.synchronous = synchronous # Visszajátszáshoz: a hívó szálában, a megadott órával dönt
+        self.deadband = deadband
+        self.min_interval = min_interval
+        self.lock = threading.Lock()
+        self.pending = None # (szint, kényszerített)
+        self.pending_event = threading.Event()
+        self.stopped = False
+        self.last_written = None
+        self.last_write_time = 0.0
+        self.submitted = 0
+        self.writes = 0
+        self.skipped_deadband = 0
+        self.coalesced = 0
+        self.thread = None
+        if not synchronous:
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
 
-        self.name_text.SetValue(bell_data.get('name', ''))
-        self.volume_slider.SetValue(bell_data.get('volume', 50))
+    def _in_deadband(self, level, force):
+        return self.last_written is not None and (level == self.last_written or
+                                                  (abs(level - self.last_written) < self.deadband and not force))
 
+    def _write(self, level):
         try:
-            index = self.sound_choice.FindString(bell_data.get('sound_file', ''))
-            if index != wx.NOT_FOUND:
-                self.sound_choice.SetSelection(index)
-            else:
-                wx.MessageBox(f"A korábbi hangfájl ({bell_data['sound_file']}) nem található. Kérjük válasszon újat.", "Hiányzó hangfájl", wx.OK | wx.ICON_WARNING)
-        except Exception as e:
-            logging.error(f"Hiba a hang...
----
-```python
-import wx
-import wx.lib.newevent
-import pygame
-import datetime
-import threading
-import time
-import json
-import os
-import sys
-import logging
-import copy
-import wx.adv
-import wx.lib.stattext # Statikus szöveg
-
-# Google Drive API importok, ha szükségesek (csak akkor, ha a felhasználó telepítette őket)
-try:
-    from google.auth.transport.requests import Request
-    from google.oauth2.credentials import Credentials
-    from google_auth_oauthlib.flow import InstalledAppFlow
-    from googleapiclient.discovery import build
-    from googleapiclient.http import MediaFileUpload, MediaIoBaseDownload
-    from io import FileIO
-    DRIVE_API_AVAILABLE = True
-except ImportError:
-    logging.warning("Google Drive API modulok nem találhatók. A Google Drive funkciók nem lesznek elérhetők.")
-    DRIVE_API_AVAILABLE = False
-
+            self.write_fn(level)
+        except Exception:
+            logging.exception("Hangerő írási hiba")
+        self.writes += 1
+        self.last_written = level
+        self.last_write_time = self.clock()
+
+    def _submit_synchronous(self, level, force):
+        # A még várakozó érték helyére lép; kiírni csak a minimális időköz letelte után szabad
+        self.submitted += 1
+        if self._in_deadband(level, force):
+            self.skipped_deadband += 1
+            return
+        if self.clock() - self.last_write_time < self.min_interval:
+            if self.pending is not None:
+                self.coalesced += 1
+            self.pending = (level, force)
+            return
+        self.pending = None
+        self._write(level)
 
-# --- Logger beállítása ---
-log_file_path = 'vekker_log.txt'
-# Gyökér logger beállítása
-logging.basicConfig(level=logging.INFO,
-                    format='%(asctime)s - %(levelname)s - %(message)s',
-                    handlers=[
-                        logging.FileHandler(log_file_path, encoding='utf-8'),
-                        logging.StreamHandler(sys.stdout)
-                    ])
+    def submit(self, level, force=False):
+        # force: nyugalmi (cél) érték, a holtsávtól függetlenül ki kell írni
+        if self.synchronous:
+            self._submit_synchronous(level, force)
+            return
+        with self.lock:
+            if self.pending is not None:
+                self.coalesced += 1
+            self.pending = (level, force)
+            self.submitted += 1
+        self.pending_event.set()
 
-# --- Google Drive API konfiguráció ---
-SCOPES = ['[https://www.googleapis.com/auth/drive.file](https://www.googleapis.com/auth/drive.file)']
-CREDENTIALS_FILE = 'credentials.json'
-TOKEN_FILE = 'token.json'
-DRIVE_FOLDER_NAME = 'Vekker_Backups'
-SCHEDULE_FILE = 'csengetesi_rend.json'
-SETTINGS_FILE = 'vekker_settings.json'
+    def _take(self):
+        with self.lock:
+            pending, self.pending = self.pending, None
+            self.pending_event.clear()
+        return pending
+
+    def _run(self):
+        while True:
+            self.pending_event.wait()
+            if self.stopped:
+                break
+            pending = self._take()
+            if pending is None:
+                continue
+            level, force = pending
+            if self._in_deadband(level, force):
+                self.skipped_deadband += 1
+                continue
+            delay = self.last_write_time + self.min_interval - self.clock()
+            if delay > 0:
+                time.sleep(delay)
+                newer = self._take()
+                if newer is not None:
+                    level, force = newer
+            self._write(level)
 
+    def stop(self):
+        self.stopped = True
+        self.pending_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=1)
 
+    def get_stats(self):
+        return {'submitted': self.submitted, 'writes': self.writes, 'skipped_deadband': self.skipped_deadband,
+                'coalesced': self.coalesced}
 
-# ==================== AdaptiveVoiceDuckerVAD (WebRTC alapú) ====================
-import pyaudio
-import numpy as np
-import webrtcvad
-import logging
-import threading
-import time
-from ctypes import cast, POINTER
-from comtypes import CLSCTX_ALL
-from pycaw.pycaw import AudioUtilities, IAudioEndpointVolume
 
 class AdaptiveVoiceDuckerVAD:
     def __init__(self,
@@ -876,40 +350,77 @@ class AdaptiveVoiceDuckerVAD:
                  attack=0.35,
                  release=0.96,
                  check_interval=0.04,
-                 vad_level=2):
+                 vad_level=2,
+                 ring_frames=50,
+                 gate_ratio=2.0,
+                 min_gate_rms=60.0,
+                 volume_deadband=0.01,
+                 backend=None,
+                 live=True,
+                 clock=time.monotonic,
+                 shared_state=None):
 
         self.min_volume = min_volume
         self.max_volume = max_volume
         self.attack = attack
         self.release = release
         self.check_interval = check_interval
+        # A simítás korábban kb. (20 ms olvasás + check_interval) lépésenként futott; most minden 20 ms-os kereten,
+        # ezért a kitevőt úgy skálázzuk, hogy a le- és felhalkulás ideje ugyanannyi maradjon
+        step_ratio = VAD_FRAME_SECONDS / (VAD_FRAME_SECONDS + check_interval)
+        self.attack_per_frame = attack ** step_ratio
+        self.release_per_frame = release ** step_ratio
         self.running = False
 
-        devices = AudioUtilities.GetSpeakers()
-        interface = devices.Activate(IAudioEndpointVolume._iid_, CLSCTX_ALL, None)
-        self.volume = cast(interface, POINTER(IAudioEndpointVolume))
+        # A PyAudio callback ide teszi a kereteket; a deque append/popleft zár nélkül szálbiztos.
+        # Teli puffernél a legrégebbi keret esik ki, ezt számoljuk.
+        self.frames = collections.deque(maxlen=ring_frames)
+        self.frame_ready = threading.Event()
+        self.frames_processed = 0
+        self.frames_dropped = 0
+        self.input_overflows = 0
+
+        # Energia előszűrő: a zajszint fölé gate_ratio-szor nem emelkedő keretek nem jutnak el a webrtcvad-ig
+        self.gate_ratio = gate_ratio
+        self.min_gate_rms = min_gate_rms
+        self.noise_floor = min_gate_rms
+        self.frames_gated = 0
+
+        self.backend = backend if backend is not None else create_volume_backend()
 
         try:
-            self.original_volume = float(self.volume.GetMasterVolumeLevelScalar())
+            self.original_volume = float(self.backend.get_volume())
         except Exception:
             logging.exception("Nem sikerült beolvasni az eredeti hangerőt, 1.0-t használunk.")
             self.original_volume = 1.0
         self.current_volume = self.original_volume
-
-        self.audio = pyaudio.PyAudio()
-        self.stream = self.audio.open(format=pyaudio.paInt16,
-                                      channels=1,
-                                      rate=16000,
-                                      input=True,
-                                      frames_per_buffer=320)  # 20ms @16kHz
+        # Az aktuális állapot egyetlen íróval; külön folyamatnál osztott memóriában (RawArray)
+        self.shared_state = shared_state if shared_state is not None else array.array('d', [0.0] * DUCKER_STATE_SIZE)
+        self.shared_state[DUCKER_STATE_LEVEL] = self.current_volume
+        # A check_interval már nem alvás, hanem a végpont írások közti minimális idő
+        # live=False: nincs mikrofon, a kereteket a hívó adja (visszajátszás), az írás szinkron a megadott órával
+        self.volume_writer = VolumeWriter(self._set_volume_safe, volume_deadband, check_interval,
+                                          clock=clock, synchronous=not live)
+
+        self.audio = None
+        self.stream = None
+        if live:
+            self.audio = pyaudio.PyAudio()
+            self.stream = self.audio.open(format=pyaudio.paInt16,
+                                          channels=1,
+                                          rate=VAD_SAMPLE_RATE,
+                                          input=True,
+                                          frames_per_buffer=VAD_FRAME_SAMPLES,
+                                          stream_callback=self._on_audio,
+                                          start=False)
 
         self.vad = webrtcvad.Vad(vad_level)
 
-        logging.info(f"AdaptiveVoiceDuckerVAD inicializálva. original_volume={self.original_volume:.2f}")
+        logging.info(f"AdaptiveVoiceDuckerVAD inicializálva. original_volume={self.original_volume:.2f}, backend={self.backend.name}")
 
     def _is_speech(self, frame: bytes) -> bool:
         try:
-            return self.vad.is_speech(frame, 16000)
+            return self.vad.is_speech(frame, VAD_SAMPLE_RATE)
         except Exception:
             return False
 
@@ -919,53 +430,285 @@ class AdaptiveVoiceDuckerVAD:
         return self.min_volume
 
     def _smooth(self, current: float, target: float) -> float:
-        alpha = self.attack if target < current else self.release
+        alpha = self.attack_per_frame if target < current else self.release_per_frame
         return alpha * current + (1.0 - alpha) * target
 
     def _set_volume_safe(self, level: float):
         level = max(0.0, min(1.0, float(level)))
         try:
-            self.volume.SetMasterVolumeLevelScalar(level, None)
+            self.backend.set_volume(level)
         except Exception:
             logging.exception("Hangerő állítás hiba")
 
+    @property
+    def level(self):
+        return self.shared_state[DUCKER_STATE_LEVEL]
+
+    @property
+    def speech(self):
+        return self.shared_state[DUCKER_STATE_SPEECH] > 0.5
+
+    def _on_audio(self, in_data, frame_count, time_info, status):
+        # PortAudio szálából hívódik: csak sorba tesszük a keretet, minden feldolgozás a fogyasztó szálban fut
+        if status & pyaudio.paInputOverflow:
+            self.input_overflows += 1
+        if len(self.frames) == self.frames.maxlen:
+            self.frames_dropped += 1
+        self.frames.append(in_data)
+        self.frame_ready.set()
+        return (None, pyaudio.paContinue)
+
     def start(self):
         logging.info("AdaptiveVoiceDuckerVAD indul...")
         self.running = True
         threading.Thread(target=self._monitor, daemon=True).start()
+        if self.stream is not None:
+            self.stream.start_stream()
+
+    def get_stats(self):
+        return {'frames_processed': self.frames_processed, 'frames_dropped': self.frames_dropped,
+                'input_overflows': self.input_overflows, 'frames_gated': self.frames_gated,
+                'gate_hit_rate': self.frames_gated / self.frames_processed if self.frames_processed else 0.0,
+                'noise_floor': round(self.noise_floor, 1), 'volume_writes': self.volume_writer.get_stats()}
 
     def stop(self):
         logging.info("AdaptiveVoiceDuckerVAD leáll, hangerő visszaállítva.")
-        self._set_volume_safe(self.original_volume)
         self.running = False
+        self.frame_ready.set()
+        self.volume_writer.stop()
+        self._set_volume_safe(self.original_volume)
+        logging.info(f"DuckerVAD statisztika: {self.get_stats()}")
+        if self.stream is None:
+            return
         try:
             self.stream.stop_stream()
             self.stream.close()
         finally:
             self.audio.terminate()
 
+    def _energy(self, frame: bytes):
+        samples = np.frombuffer(frame, dtype=np.int16).astype(np.float32)
+        return float(np.sqrt(np.mean(samples * samples))), float(np.max(np.abs(samples)))
+
+    def _update_noise_floor(self, rms: float):
+        # Gyorsan követi a csendesedést, lassan a hangosodást, hogy a beszéd ne emelje meg a küszöböt
+        alpha = 0.9 if rms < self.noise_floor else 0.995
+        self.noise_floor = max(alpha * self.noise_floor + (1.0 - alpha) * rms, 1.0)
+
+    def _process_frame(self, frame: bytes):
+        rms, peak = self._energy(frame)
+        threshold = max(self.noise_floor * self.gate_ratio, self.min_gate_rms)
+        if rms < threshold and peak < threshold * 4.0:
+            speech = False
+            self.frames_gated += 1
+        else:
+            speech = self._is_speech(frame)
+        if not speech:
+            self._update_noise_floor(rms)
+        target_volume = self._compute_target_volume(speech)
+        prev = self.current_volume
+        self.current_volume = self._smooth(self.current_volume, target_volume)
+        settled = abs(self.current_volume - target_volume) < 0.001
+        if settled:
+            self.current_volume = target_volume
+        self.volume_writer.submit(self.current_volume, force=settled)
+        self.shared_state[DUCKER_STATE_LEVEL] = self.current_volume
+        self.shared_state[DUCKER_STATE_SPEECH] = 1.0 if speech else 0.0
+        self.shared_state[DUCKER_STATE_FRAMES] = self.frames_processed + 1
+        self.frames_processed += 1
+        if self.frames_processed % STATS_LOG_FRAMES == 0:
+            logging.info(f"DuckerVAD statisztika: {self.get_stats()}")
+        logging.debug(f"[DuckerVAD] speech={speech} target={target_volume:.2f} vol={self.current_volume:.2f} prev={prev:.2f}")
+        return speech
+
     def _monitor(self):
+        # Fogyasztó: a callback jelzésére felébred és minden beérkezett 20 ms-os keretet feldolgoz
         logging.info("AdaptiveVoiceDuckerVAD szál elindult.")
         while self.running:
+            self.frame_ready.wait(timeout=0.5)
+            self.frame_ready.clear()
+            while self.running and self.frames:
+                try:
+                    self._process_frame(self.frames.popleft())
+                except Exception:
+                    logging.exception("Hiba a mikrofon keret feldolgozásakor")
+        logging.info("AdaptiveVoiceDuckerVAD szál leállt.")
+
+
+def _wav_frames(path):
+    # WAV fájl tetszőleges formátumból 16 kHz mono, 16 bites 20 ms-os keretekre bontva, másodpercenkénti blokkokban olvasva
+    with wave.open(path, 'rb') as wav:
+        source_rate = wav.getframerate()
+        leftover = np.zeros(0, dtype=np.int16)
+        while True:
+            frames = wav.readframes(source_rate)
+            if not frames:
+                break
+            data = _pcm_to_float(frames, wav.getsampwidth(), wav.getnchannels()).mean(axis=1)
+            if source_rate != VAD_SAMPLE_RATE:
+                target_length = int(round(len(data) * VAD_SAMPLE_RATE / source_rate))
+                data = np.interp(np.linspace(0, len(data) - 1, target_length), np.arange(len(data)), data)
+            samples = np.concatenate([leftover, (np.clip(data, -1.0, 1.0) * 32767).astype(np.int16)])
+            usable = len(samples) - len(samples) % VAD_FRAME_SAMPLES
+            for start in range(0, usable, VAD_FRAME_SAMPLES):
+                yield samples[start:start + VAD_FRAME_SAMPLES].tobytes()
+            leftover = samples[usable:]
+
+
+def replay_ducker(wav_path, trajectory_path=None, **ducker_options):
+    # Felvett hang lejátszása a ducker feldolgozó láncán szimulált órával, a valós időnél gyorsabban.
+    # Visszaadja az áteresztőképességet, a beszédkezdet -> lehalkulás és a beszédvég -> visszaállás idejét.
+    sim_time = [0.0]
+    clock = lambda: sim_time[0]
+    backend = MemoryVolumeBackend(level=ducker_options.pop('original_volume', 1.0), clock=clock)
+    ducker = AdaptiveVoiceDuckerVAD(backend=backend, live=False, clock=clock, **ducker_options)
+    duck_level = ducker.min_volume + 0.1 * (ducker.original_volume - ducker.min_volume)
+    release_level = ducker.original_volume - 0.1 * (ducker.original_volume - ducker.min_volume)
+
+    trajectory = []
+    duck_latencies, release_times = [], []
+    onset_time = offset_time = None
+    previous_speech = False
+    started = time.perf_counter()
+    for index, frame in enumerate(_wav_frames(wav_path)):
+        sim_time[0] = index * VAD_FRAME_SECONDS
+        speech = ducker._process_frame(frame)
+        if speech and not previous_speech:
+            onset_time, offset_time = sim_time[0], None
+        elif previous_speech and not speech:
+            offset_time = sim_time[0]
+        previous_speech = speech
+        level = backend.level
+        if onset_time is not None and level <= duck_level:
+            duck_latencies.append(sim_time[0] - onset_time)
+            onset_time = None
+        if offset_time is not None and level >= release_level:
+            release_times.append(sim_time[0] - offset_time)
+            offset_time = None
+        trajectory.append((round(sim_time[0], 3), speech, round(ducker.current_volume, 4), round(level, 4)))
+    wall_seconds = time.perf_counter() - started
+
+    if trajectory_path:
+        with open(trajectory_path, 'w', encoding='utf-8') as f:
+            f.write('time,speech,smoothed_volume,endpoint_volume\n')
+            f.writelines(f"{t},{int(speech)},{smoothed},{endpoint}\n" for t, speech, smoothed, endpoint in trajectory)
+
+    def summary(values):
+        values = sorted(values)
+        if not values:
+            return {'count': 0}
+        return {'count': len(values), 'p50': round(values[len(values) // 2], 3), 'max': round(values[-1], 3)}
+
+    audio_seconds = len(trajectory) * VAD_FRAME_SECONDS
+    return {
+        'frames': len(trajectory),
+        'audio_seconds': round(audio_seconds, 2),
+        'wall_seconds': round(wall_seconds, 3),
+        'frames_per_second': round(len(trajectory) / wall_seconds, 1) if wall_seconds else None,
+        'realtime_factor': round(audio_seconds / wall_seconds, 1) if wall_seconds else None,
+        'duck_latency': summary(duck_latencies),
+        'release_time': summary(release_times),
+        'ducker': ducker.get_stats(),
+    }
+
+def _ducker_process_main(connection, shared_state, options, backend_name):
+    # A külön folyamat belépési pontja: saját GIL-lel futtatja a duckert, a csövön át vezérelhető
+    try:
+        ducker = AdaptiveVoiceDuckerVAD(backend=create_volume_backend(backend_name), shared_state=shared_state, **options)
+        ducker.start()
+    except Exception as e:
+        logging.exception("DuckerVAD indítási hiba a külön folyamatban.")
+        connection.send(('error', str(e)))
+        return
+    connection.send(('ready', None))
+    while True:
+        try:
+            command = connection.recv()
+        except (EOFError, OSError):
+            command = 'stop' # A szülő folyamat eltűnt: a hangerőt vissza kell állítani
+        if command == 'stats':
+            connection.send(('stats', ducker.get_stats()))
+        elif command == 'stop':
+            ducker.stop()
             try:
-                frame = self.stream.read(320, exception_on_overflow=False)
-            except Exception:
-                logging.exception("Mikrofon olvasási hiba")
-                time.sleep(0.1)
-                continue
+                connection.send(('stopped', ducker.get_stats()))
+            except (BrokenPipeError, OSError):
+                pass
+            return
+
+
+class DuckerProcess:
+    # Az AdaptiveVoiceDuckerVAD külön folyamatban, a fő folyamat GIL-jétől függetlenül.
+    # Vezérlés csövön át; az aktuális szint és a beszéd állapot osztott memóriából zár nélkül olvasható.
+    def __init__(self, backend_name='auto', **options):
+        # spawn: a fork a wx/SDL/időzítő szálakkal teli folyamatból egy éppen foglalt zárat (pl. a naplózóét)
+        # is örökölhetne, amin a gyermek holtpontra jutna
+        context = multiprocessing.get_context('spawn')
+        self.shared_state = context.RawArray('d', DUCKER_STATE_SIZE)
+        self.shared_state[DUCKER_STATE_LEVEL] = 1.0
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(target=_ducker_process_main, daemon=True,
+                                               args=(child_connection, self.shared_state, options, backend_name))
+        self.lock = threading.Lock() # A csövön egyszerre egy kérés-válasz
+
+    @property
+    def level(self):
+        return self.shared_state[DUCKER_STATE_LEVEL]
+
+    @property
+    def speech(self):
+        return self.shared_state[DUCKER_STATE_SPEECH] > 0.5
+
+    def start(self):
+        self.process.start()
+        if not self.connection.poll(15):
+            self.process.terminate()
+            raise RuntimeError("A ducker folyamat nem indult el időben.")
+        status, message = self.connection.recv()
+        if status == 'error':
+            self.process.join(timeout=1)
+            raise RuntimeError(message)
+        logging.info(f"DuckerVAD külön folyamatban fut (pid {self.process.pid}).")
+
+    def get_stats(self):
+        with self.lock:
+            try:
+                self.connection.send('stats')
+                if self.connection.poll(1):
+                    return self.connection.recv()[1]
+            except (BrokenPipeError, EOFError, OSError):
+                pass
+        return {}
+
+    def stop(self):
+        with self.lock:
+            try:
+                self.connection.send('stop')
+                if self.connection.poll(3):
+                    logging.info(f"DuckerVAD folyamat statisztika: {self.connection.recv()[1]}")
+            except (BrokenPipeError, EOFError, OSError):
+                pass
+        self.process.join(timeout=2)
+        if self.process.is_alive():
+            self.process.terminate()
 
-            speech = self._is_speech(frame)
-            target_volume = self._compute_target_volume(speech)
-            prev = self.current_volume
-            self.current_volume = self._smooth(self.current_volume, target_volume)
-            self._set_volume_safe(self.current_volume)
-            logging.debug(f"[DuckerVAD] speech={speech} target={target_volume:.2f} vol={self.current_volume:.2f} prev={prev:.2f}")
-            time.sleep(self.check_interval)
-        logging.info("AdaptiveVoiceDuckerVAD szál leállt.")
 # =================================================================
 
 # --- Segéd változók ---
 WEEKDAYS_HUNGARIAN = ["Hétfő", "Kedd", "Szerda", "Csütörtök", "Péntek", "Szombat", "Vasárnap"]
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+# A zóna nélküli csengetések zónája (egy épület / hangszóró csoport)
+DEFAULT_ZONE = "Alap"
+# Az esedékesség előtti utolsó szakaszban nem az OS időzítőjére bízzuk az ébredést (mp)
+SPIN_THRESHOLD = 0.02
+# A beállítás szövegmezők ennyi ms gépelési szünet után érvényesülnek
+TEXT_APPLY_DELAY_MS = 500
+
+
+def minute_of_week(moment):
+    # Hétfő 00:00 = 0, Vasárnap 23:59 = 10079
+    return moment.weekday() * MINUTES_PER_DAY + moment.hour * 60 + moment.minute
 
 # Egyedi esemény a hang lejátszás befejezéséhez
 BellFinishedPlayingEvent, EVT_BELL_FINISHED_PLAYING = wx.lib.newevent.NewEvent()
@@ -998,6 +741,7 @@ class GoogleDriveManager:
         if not DRIVE_API_AVAILABLE:
             self._update_status("Google Drive API modulok hiányoznak.", authenticated=False)
             return None
+        load_drive_api()
 
         with self.lock: # Zár biztosítja a szálbiztos hozzáférést a creds-hez és service-hez
             if self.creds and self.creds.valid and self.service:
@@ -1206,11 +950,57 @@ class GoogleDriveManager:
             logging.error(f"Hiba a Google Drive letöltés során: {e}")
             self._update_status(f"Letöltési hiba: {e}", authenticated=True)
 
+class DebouncedWriter:
+    # Késleltetett (write-behind) mentés: a rövid időn belüli változásokból egyetlen írás lesz
+    def __init__(self, write_fn, delay=1.0):
+        self.write_fn = write_fn
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock() # Egyszerre egy írás; a flush a folyamatban lévőt is megvárja
+        self.timer = None
+        self.pending = False
+        self.requests = 0
+        self.writes = 0
+
+    def request(self):
+        with self.lock:
+            self.requests += 1
+            self.pending = True
+            if self.timer:
+                self.timer.cancel()
+            self.timer = threading.Timer(self.delay, self._fire)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def _take_pending(self):
+        with self.lock:
+            if self.timer:
+                self.timer.cancel()
+                self.timer = None
+            pending, self.pending = self.pending, False
+            return pending
+
+    def _fire(self):
+        with self.write_lock:
+            if self._take_pending():
+                self.writes += 1
+                self.write_fn()
+
+    def flush(self):
+        # Azonnali írás, ha van függő változás (pl. kilépéskor)
+        self._fire()
+
+    def cancel(self):
+        # A függő írás eldobása, pl. ha a fájlt kívülről (Drive) cserélték le
+        self._take_pending()
+
+
 class SettingsManager:
     def __init__(self, main_frame):
         self.main_frame = main_frame
         self.settings_file = SETTINGS_FILE
         self.settings = self.load_settings()
+        self.writer = DebouncedWriter(self.save_settings)
 
     def load_settings(self):
         if os.path.exists(self.settings_file):
@@ -1225,34 +1015,116 @@ class SettingsManager:
         return {
             'volume': 50,
             'check_interval': 5.0,
+            'catchup_window': 60.0, # Ennyi mp késésig még megszólal az elmaradt csengetés
+            'sound_cache_mb': 64, # Dekódolt hangok gyorsítótárának memóriakorlátja
+            'preroll_seconds': 5.0, # Ennyivel az esedékesség előtt készítjük elő a hangot
+            'mixer_channels': 16, # Egyszerre szóló hangok (zónák) legnagyobb száma
+            'mixer_buffer': 2048, # Keverő puffer mérete (minta)
+            'loudness_normalization': False, # A hangerő minden fájlnál azonos érzékelt hangosságot jelentsen (csak halkít)
+            'target_loudness_db': -20.0,
+            'stream_threshold_mb': 8, # Ennél nagyobb fájlokat nem töltünk be egészben, hanem streamelünk
+            'stream_chunk_seconds': 0.5,
+            'stream_ring_chunks': 4,
+            'zones': {DEFAULT_ZONE: {'volume': 100}}, # Zónánkénti hangerő
+            'alarm_sound': '', # Vészjelzés hangfájlja a hangok mappából; üres: beépített sziréna
+            'alarm_volume': 100,
+            'alarm_port': ALARM_PORT,
+            'ducking_backend': 'auto', # pycaw, pulseaudio, alsa, memory, mixer (csak a Vekker hangjai) vagy auto
+            'ducking_process': False, # A ducker külön folyamatban fusson
             'ducking_enabled': False # Új beállítás
         }
 
     def save_settings(self):
+        # A DebouncedWriter időzítő száláról is hívódik, ezért a UI-t csak CallAfter-rel érjük el
+        temp_file = self.settings_file + '.tmp'
         try:
-            with open(self.settings_file, 'w', encoding='utf-8') as f:
-                json.dump(self.settings, f, indent=4)
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump(dict(self.settings), f, indent=4)
+            os.replace(temp_file, self.settings_file)
             logging.info("Beállítások elmentve.")
-            self.main_frame.show_status_message("Beállítások elmentve.")
+            wx.CallAfter(self.main_frame.show_status_message, "Beállítások elmentve.")
             # Feltöltés Google Drive-ra is, ha be van jelentkezve
             if self.main_frame.drive_manager.authenticated:
                 self.main_frame.drive_manager.upload_file_to_drive(self.settings_file)
         except Exception as e:
             logging.error(f"Hiba a beállítások mentésekor: {e}")
-            self.main_frame.show_status_message(f"Hiba a beállítások mentésekor: {e}")
+            wx.CallAfter(self.main_frame.show_status_message, f"Hiba a beállítások mentésekor: {e}")
+
+    def reload_settings(self):
+        # Kívülről frissült fájl: a függő mentés felülírná, ezért eldobjuk
+        self.writer.cancel()
+        self.settings = self.load_settings()
+
+    def flush(self):
+        self.writer.flush()
 
     def get_setting(self, key, default=None):
         return self.settings.get(key, default)
 
     def set_setting(self, key, value):
         self.settings[key] = value
-        self.save_settings()
+        self.writer.request()
+
+class ScheduleSnapshot(collections.namedtuple('ScheduleSnapshot', ['version', 'bells', 'timeline', 'timeline_minutes', 'bells_by_id'])):
+    # Megváltoztathatatlan, verziózott csengetési rend; az olvasók másolás nélkül használhatják
+    __slots__ = ()
+
+    def bells_at(self, minute_of_week):
+        # Az adott hét-percben szóló csengetések
+        ids = self.timeline[minute_of_week]
+        if ids is None:
+            return []
+        return [self.bells_by_id[bell_id] for bell_id in ids]
+
+    def next_minute(self, minute_of_week):
+        # Az első foglalt hét-perc az adott perctől (azt is beleértve), körbefordulva a hét végén
+        if not self.timeline_minutes:
+            return None
+        position = bisect.bisect_left(self.timeline_minutes, minute_of_week)
+        if position == len(self.timeline_minutes):
+            return self.timeline_minutes[0]
+        return self.timeline_minutes[position]
+
+    def minutes_between(self, start_minute, count):
+        # A foglalt percek eltolásai (start_minute-tól számítva) a [start, start + count) tartományban,
+        # legfeljebb egy hétre, két bisect szeletből
+        count = min(count, MINUTES_PER_WEEK)
+        end_minute = start_minute + count
+        minutes = self.timeline_minutes
+        low = bisect.bisect_left(minutes, start_minute)
+        high = bisect.bisect_left(minutes, min(end_minute, MINUTES_PER_WEEK))
+        offsets = [minute - start_minute for minute in minutes[low:high]]
+        if end_minute > MINUTES_PER_WEEK:
+            wrapped_high = bisect.bisect_left(minutes, end_minute - MINUTES_PER_WEEK)
+            offsets.extend(minute + MINUTES_PER_WEEK - start_minute for minute in minutes[:wrapped_high])
+        return offsets
+
 
 class BellScheduleManager:
     def __init__(self, main_frame):
         self.main_frame = main_frame
         self.schedule_file = SCHEDULE_FILE
-        self.bell_schedule = self.load_bell_schedule()
+        self.listeners = [] # Értesítendők az ütemezés változásakor (pl. BellChecker)
+        self.lock = threading.Lock() # Csak az írók zárnak, az olvasók a pillanatképet használják
+        self.next_bell_id = 1
+        # Hét-perc (0..10079) -> csengetés azonosítók tömörített tömbje, a pillanatkép része
+        self.snapshot = ScheduleSnapshot(0, (), (None,) * MINUTES_PER_WEEK, (), {})
+        self._replace_all(self.load_bell_schedule())
+        self.writer = DebouncedWriter(self._write_bell_schedule)
+
+    @property
+    def bell_schedule(self):
+        return self.snapshot.bells
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+    def _notify_listeners(self):
+        for callback in list(self.listeners):
+            try:
+                callback()
+            except Exception as e:
+                logging.error(f"Hiba az ütemezés változás értesítésekor: {e}")
 
     def load_bell_schedule(self):
         if os.path.exists(self.schedule_file):
@@ -1267,94 +1139,241 @@ class BellScheduleManager:
         logging.info("Nincs meglévő csengetési rend fájl, üres lista indul.")
         return []
 
+    def reload_bell_schedule(self):
+        # Újratöltés fájlból (pl. Google Drive letöltés után), az értesítettek is frissülnek
+        self.writer.cancel()
+        self._replace_all(self.load_bell_schedule())
+        self._notify_listeners()
+
+    # --- Pillanatképek ---
+    @staticmethod
+    def _freeze_bell(bell_data):
+        bell = dict(bell_data)
+        bell['weekdays'] = tuple(bell.get('weekdays', []))
+        if bell.get('tone'):
+            bell['tone'] = types.MappingProxyType(dict(bell['tone']))
+        return types.MappingProxyType(bell)
+
+    @staticmethod
+    def _thaw_bell(bell):
+        # Szerkeszthető másolat a UI számára (a napok listája az egyetlen belső tároló)
+        bell_data = dict(bell)
+        bell_data['weekdays'] = list(bell_data.get('weekdays', []))
+        if bell_data.get('tone'):
+            bell_data['tone'] = dict(bell_data['tone'])
+        return bell_data
+
+    def _replace_all(self, schedule):
+        with self.lock:
+            self.next_bell_id = 1
+            index = ([None] * MINUTES_PER_WEEK, [], {})
+            bells = [self._index_add(index, bell_data) for bell_data in schedule]
+            self._publish(bells, index)
+
+    def _edit(self):
+        # Írói munkapéldány: a régi pillanatkép érintetlen marad, amíg az új meg nem jelenik
+        snapshot = self.snapshot
+        return list(snapshot.bells), (list(snapshot.timeline), list(snapshot.timeline_minutes), dict(snapshot.bells_by_id))
+
+    def _publish(self, bells, index):
+        # Rendezzük az csengetéseket idő szerint, majd egyetlen hivatkozás-cserével közzétesszük
+        bells.sort(key=self._sort_key)
+        timeline, timeline_minutes, bells_by_id = index
+        self.snapshot = ScheduleSnapshot(self.snapshot.version + 1, tuple(bells), tuple(timeline),
+                                         tuple(timeline_minutes), bells_by_id)
+
+    @staticmethod
+    def _sort_key(bell):
+        # Hibás időpontú csengetés nem akaszthatja meg a betöltést; ezek a lista végére kerülnek
+        try:
+            return (0, datetime.datetime.strptime(bell['time'], "%H:%M").time())
+        except (KeyError, TypeError, ValueError):
+            return (1, datetime.time())
+
+    # --- Hét-perc idővonal index ---
+    @staticmethod
+    def _bell_minutes(bell):
+        # Az engedélyezett csengetés összes hét-perce (üres napi lista = minden nap)
+        if not bell.get('enabled', True):
+            return []
+        try:
+            bell_time = datetime.datetime.strptime(bell['time'], "%H:%M")
+        except (KeyError, TypeError, ValueError) as e:
+            logging.error(f"Hibás csengetési időpont, kihagyva az indexből: {bell.get('time')} ({e})")
+            return []
+        minute_of_day = bell_time.hour * 60 + bell_time.minute
+        bell_weekdays = bell.get('weekdays', [])
+        if bell_weekdays:
+            day_indices = sorted({WEEKDAYS_HUNGARIAN.index(day) for day in bell_weekdays if day in WEEKDAYS_HUNGARIAN})
+        else:
+            day_indices = range(7)
+        return [day_index * MINUTES_PER_DAY + minute_of_day for day_index in day_indices]
+
+    def _index_add(self, index, bell_data):
+        # Azonosítót ad, befagyasztja és az indexbe teszi a csengetést; a befagyasztott példányt adja vissza
+        timeline, timeline_minutes, bells_by_id = index
+        bell_data = dict(bell_data)
+        bell_id = bell_data.get('id')
+        if not isinstance(bell_id, int) or bell_id <= 0 or bell_id in bells_by_id:
+            bell_id = self.next_bell_id
+            bell_data['id'] = bell_id
+        self.next_bell_id = max(self.next_bell_id, bell_id + 1)
+        bell = self._freeze_bell(bell_data)
+        bells_by_id[bell_id] = bell
+        for minute in self._bell_minutes(bell):
+            ids = timeline[minute]
+            if ids is None:
+                timeline[minute] = array.array('I', [bell_id])
+                bisect.insort(timeline_minutes, minute)
+            else:
+                # Új tömb, mert a régit a korábbi pillanatkép olvasói még használhatják
+                timeline[minute] = ids + array.array('I', [bell_id])
+        return bell
+
+    def _index_remove(self, index, bell):
+        timeline, timeline_minutes, bells_by_id = index
+        bell_id = bell.get('id')
+        bells_by_id.pop(bell_id, None)
+        for minute in self._bell_minutes(bell):
+            ids = timeline[minute]
+            if ids is None or bell_id not in ids:
+                continue
+            remaining = array.array('I', [other_id for other_id in ids if other_id != bell_id])
+            if remaining:
+                timeline[minute] = remaining
+            else:
+                timeline[minute] = None
+                position = bisect.bisect_left(timeline_minutes, minute)
+                del timeline_minutes[position]
+
+    def bells_at(self, minute_of_week):
+        return self.snapshot.bells_at(minute_of_week)
+
+    def next_minute(self, minute_of_week):
+        return self.snapshot.next_minute(minute_of_week)
+
     def save_bell_schedule(self):
+        # A memóriában már érvényes a változás, az ellenőrző a fájlírástól függetlenül frissülhet
+        self._notify_listeners()
+        self.writer.request()
+
+    def flush(self):
+        self.writer.flush()
+
+    def _write_bell_schedule(self):
+        # Mindig a legfrissebb pillanatképet írjuk ki, így a közben összegyűlt változások egyszerre mentődnek
+        snapshot = self.snapshot
+        temp_file = self.schedule_file + '.tmp'
         try:
-            # Rendezzük az csengetéseket idő szerint mentés előtt
-            self.bell_schedule.sort(key=lambda x: datetime.datetime.strptime(x['time'], "%H:%M").time())
-            with open(self.schedule_file, 'w', encoding='utf-8') as f:
-                json.dump(self.bell_schedule, f, indent=4)
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump([self._thaw_bell(bell) for bell in snapshot.bells], f, indent=4)
+            os.replace(temp_file, self.schedule_file)
             logging.info("Csengetési rend elmentve.")
-            self.main_frame.show_status_message("Csengetési rend elmentve.")
+            wx.CallAfter(self.main_frame.show_status_message, "Csengetési rend elmentve.")
             # Feltöltés Google Drive-ra is, ha be van jelentkezve
             if self.main_frame.drive_manager.authenticated:
                 self.main_frame.drive_manager.upload_file_to_drive(self.schedule_file)
         except Exception as e:
             logging.error(f"Hiba az csengetési rend mentésekor: {e}")
-            self.main_frame.show_status_message(f"Hiba az csengetési rend mentésekor: {e}")
+            wx.CallAfter(self.main_frame.show_status_message, f"Hiba az csengetési rend mentésekor: {e}")
 
     def add_bell(self, bell_data):
-        self.bell_schedule.append(bell_data)
+        with self.lock:
+            bells, index = self._edit()
+            bells.append(self._index_add(index, bell_data))
+            self._publish(bells, index)
         logging.info(f"Új csengetés hozzáadva: {bell_data['time']}")
         self.save_bell_schedule()
 
     def update_bell(self, index, new_bell_data):
-        if 0 <= index < len(self.bell_schedule):
-            self.bell_schedule[index] = new_bell_data
-            logging.info(f"Csengetés frissítve (index: {index}): {new_bell_data['time']}")
-            self.save_bell_schedule()
-            return True
-        return False
+        with self.lock:
+            bells, timeline_index = self._edit()
+            if not 0 <= index < len(bells):
+                return False
+            old_bell = bells[index]
+            self._index_remove(timeline_index, old_bell)
+            new_bell_data = dict(new_bell_data)
+            new_bell_data['id'] = old_bell.get('id') # Az azonosító a szerkesztés után is marad
+            bells[index] = self._index_add(timeline_index, new_bell_data)
+            self._publish(bells, timeline_index)
+        logging.info(f"Csengetés frissítve (index: {index}): {new_bell_data['time']}")
+        self.save_bell_schedule()
+        return True
 
     def delete_bell(self, index):
-        if 0 <= index < len(self.bell_schedule):
-            deleted_bell = self.bell_schedule.pop(index)
-            logging.info(f"Csengetés törölve (index: {index}): {deleted_bell['time']}")
-            self.save_bell_schedule()
-            return True
-        return False
+        with self.lock:
+            bells, timeline_index = self._edit()
+            if not 0 <= index < len(bells):
+                return False
+            deleted_bell = bells.pop(index)
+            self._index_remove(timeline_index, deleted_bell)
+            self._publish(bells, timeline_index)
+        logging.info(f"Csengetés törölve (index: {index}): {deleted_bell['time']}")
+        self.save_bell_schedule()
+        return True
 
     def get_bell_by_index(self, index):
-        if 0 <= index < len(self.bell_schedule):
-            return copy.deepcopy(self.bell_schedule[index])
+        bells = self.snapshot.bells
+        if 0 <= index < len(bells):
+            return self._thaw_bell(bells[index])
         return None
 
     def get_bells_for_day(self, day):
         # Ha "Összes nap" van kiválasztva, visszaadjuk az összes csengetést
+        bells = self.snapshot.bells
         if day == "Összes nap":
-            return self.bell_schedule
-        return [bell for bell in self.bell_schedule if day in bell.get('weekdays', [])]
+            return list(bells)
+        return [bell for bell in bells if day in bell.get('weekdays', ())]
 
     def copy_bells_to_days(self, source_day, destination_days):
         if source_day not in WEEKDAYS_HUNGARIAN:
             logging.error(f"Érvénytelen forrás nap: {source_day}")
             return
 
-        bells_to_copy = self.get_bells_for_day(source_day)
         added_count = 0
         skipped_count = 0
 
-        for dest_day in destination_days:
-            if dest_day not in WEEKDAYS_HUNGARIAN:
-                logging.warning(f"Érvénytelen cél nap kihagyva: {dest_day}")
-                continue
-            if dest_day == source_day:
-                logging.info(f"Forrás és cél nap megegyezik ({dest_day}), kihagyva a másolást ide.")
-                continue
+        with self.lock:
+            bells, index = self._edit()
+            bells_to_copy = [bell for bell in bells if source_day in bell.get('weekdays', ())]
 
-            for bell in bells_to_copy:
-                # Létrehozunk egy mély másolatot az csengetésről
-                new_bell = copy.deepcopy(bell)
-
-                # Frissítjük a napokat az új napra
-                new_bell['weekdays'] = [dest_day]
-
-                # Ellenőrizzük, hogy létezik-e már pontosan ilyen csengetés a cél napon
-                # (idő, hangfájl és név egyezik az adott napra)
-                already_exists = False
-                for existing_bell in self.get_bells_for_day(dest_day):
-                    if (existing_bell['time'] == new_bell['time'] and
-                        existing_bell.get('name') == new_bell.get('name') and
-                        existing_bell.get('sound_file') == new_bell.get('sound_file')):
-                        already_exists = True
-                        break
+            for dest_day in destination_days:
+                if dest_day not in WEEKDAYS_HUNGARIAN:
+                    logging.warning(f"Érvénytelen cél nap kihagyva: {dest_day}")
+                    continue
+                if dest_day == source_day:
+                    logging.info(f"Forrás és cél nap megegyezik ({dest_day}), kihagyva a másolást ide.")
+                    continue
 
-                if not already_exists:
-                    self.bell_schedule.append(new_bell)
-                    added_count += 1
-                    logging.info(f"Csengetés másolva: {new_bell['time']} - {new_bell.get('name')} ide: {dest_day}")
-                else:
-                    skipped_count += 1
-                    logging.info(f"Duplikátum csengetés kihagyva: {new_bell['time']} - {new_bell.get('name')} ide: {dest_day}")
+                for bell in bells_to_copy:
+                    # Létrehozunk egy szerkeszthető másolatot az csengetésről
+                    new_bell = self._thaw_bell(bell)
+
+                    # Frissítjük a napokat az új napra, a másolat új azonosítót kap
+                    new_bell['weekdays'] = [dest_day]
+                    new_bell.pop('id', None)
+
+                    # Ellenőrizzük, hogy létezik-e már pontosan ilyen csengetés a cél napon
+                    # (idő, hangfájl és név egyezik az adott napra)
+                    already_exists = False
+                    for existing_bell in bells:
+                        if (dest_day in existing_bell.get('weekdays', ()) and
+                            existing_bell['time'] == new_bell['time'] and
+                            existing_bell.get('name') == new_bell.get('name') and
+                            existing_bell.get('sound_file') == new_bell.get('sound_file')):
+                            already_exists = True
+                            break
+
+                    if not already_exists:
+                        bells.append(self._index_add(index, new_bell))
+                        added_count += 1
+                        logging.info(f"Csengetés másolva: {new_bell['time']} - {new_bell.get('name')} ide: {dest_day}")
+                    else:
+                        skipped_count += 1
+                        logging.info(f"Duplikátum csengetés kihagyva: {new_bell['time']} - {new_bell.get('name')} ide: {dest_day}")
+
+            if added_count > 0:
+                self._publish(bells, index)
 
         if added_count > 0:
             self.save_bell_schedule()
@@ -1366,87 +1385,1138 @@ class BellScheduleManager:
             logging.info("Nincs új csengetés másolva.")
 
 
+class LatencyHistogram:
+    # Késés hisztogram (ms vödrök) és csúszóablakos minták a percentilisekhez
+    BUCKET_BOUNDS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+    def __init__(self, window=1000):
+        self.lock = threading.Lock()
+        self.samples = collections.deque(maxlen=window)
+        self.bucket_counts = [0] * (len(self.BUCKET_BOUNDS_MS) + 1)
+        self.count = 0
+
+    def record(self, latency_seconds):
+        latency_ms = latency_seconds * 1000.0
+        with self.lock:
+            self.samples.append(latency_ms)
+            self.bucket_counts[bisect.bisect_left(self.BUCKET_BOUNDS_MS, latency_ms)] += 1
+            self.count += 1
+
+    def summary(self):
+        with self.lock:
+            samples = sorted(self.samples)
+            bucket_counts = list(self.bucket_counts)
+            count = self.count
+
+        def percentile(p):
+            if not samples:
+                return None
+            return samples[min(len(samples) - 1, int(round(p / 100.0 * (len(samples) - 1))))]
+
+        labels = [f"<={bound}ms" for bound in self.BUCKET_BOUNDS_MS] + [f">{self.BUCKET_BOUNDS_MS[-1]}ms"]
+        return {
+            'count': count,
+            'p50': percentile(50),
+            'p95': percentile(95),
+            'p99': percentile(99),
+            'max': samples[-1] if samples else None,
+            'buckets': dict(zip(labels, bucket_counts)),
+        }
+
+
+class WallClockAnchor:
+    # A falióra szerinti célpontokat a time.monotonic()-hoz köti, és észleli az óraugrásokat,
+    # illetve az alvásból/felfüggesztésből való ébredést
+    def __init__(self, jump_threshold=2.0, suspend_slack=5.0):
+        self.jump_threshold = jump_threshold
+        self.suspend_slack = suspend_slack
+        self.jump_count = 0
+        self.suspend_count = 0
+        self.expected_sleep = 0.0
+        self.resync()
+
+    def resync(self):
+        self.last_wall = time.time()
+        self.last_mono = time.monotonic()
+        self.offset = self.last_wall - self.last_mono
+
+    def expect(self, timeout):
+        # A következő várakozás leghosszabb ideje; ennél sokkal hosszabb kimaradás felfüggesztést jelez
+        self.expected_sleep = timeout or 0.0
+
+    def check_wake(self):
+        # 'jump', ha a falióra a monotonhoz képest ugrott (NTP lépés, kézi állítás),
+        # 'suspend', ha a szál a vártnál jóval tovább állt, különben None
+        wall_gap = time.time() - self.last_wall
+        mono_gap = time.monotonic() - self.last_mono
+        drift = wall_gap - mono_gap
+        # A kis eltérést (NTP óraigazítás) csendben követjük, hogy a célpontok a falióra másodpercére essenek
+        self.resync()
+        if abs(drift) >= self.jump_threshold:
+            self.jump_count += 1
+            logging.warning(f"Óraugrás észlelve: {drift:+.1f} mp, időzítés újraszinkronizálva.")
+            return 'jump'
+        if wall_gap > self.expected_sleep + self.suspend_slack:
+            self.suspend_count += 1
+            logging.warning(f"Ébredés alvásból/felfüggesztésből: {wall_gap:.1f} mp kimaradás.")
+            return 'suspend'
+        return None
+
+    def seconds_until(self, wall_timestamp):
+        return (wall_timestamp - self.offset) - time.monotonic()
+
+
+def file_sha1(path):
+    # Fájltartalom hash, módosítási idő és méret alapján memorizálva, hogy ne olvassuk újra feleslegesen
+    stat = os.stat(path)
+    cached = _file_hashes.get(path)
+    if cached is not None and cached[:2] == (stat.st_mtime, stat.st_size):
+        return cached[2]
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    _file_hashes[path] = (stat.st_mtime, stat.st_size, digest.hexdigest())
+    return digest.hexdigest()
+
+
+_file_hashes = {} # útvonal -> (módosítási idő, méret, hash)
+
+
+class PCMCache:
+    # A hangok egyszeri átkódolása a mixer formátumára (mintavétel, mintaformátum, csatornák) nyers PCM fájlba,
+    # tartalom-hash szerint. Lejátszáskor a fájlt memóriába képezzük, így nincs dekódolás és átmintavételezés.
+    def __init__(self, cache_dir=PCM_CACHE_DIR, max_file_bytes=None):
+        self.cache_dir = cache_dir
+        self.max_file_bytes = max_file_bytes # A streamelt (nagy) fájlokat nem kódoljuk át
+        self.lock = threading.Lock() # Ugyanazt a fájlt ne kódolja át két szál egyszerre
+        self.transcoded = 0
+
+    def cache_path(self, path):
+        frequency, sample_format, channels = pygame.mixer.get_init()
+        return os.path.join(self.cache_dir, f"{file_sha1(path)}_{frequency}_{sample_format}_{channels}.pcm")
+
+    def transcode(self, path):
+        cache_path = self.cache_path(path)
+        with self.lock:
+            if os.path.exists(cache_path):
+                return cache_path
+            os.makedirs(self.cache_dir, exist_ok=True)
+            raw = pygame.mixer.Sound(path).get_raw()
+            temp_file = cache_path + '.tmp'
+            with open(temp_file, 'wb') as f:
+                f.write(raw)
+            os.replace(temp_file, cache_path)
+            self.transcoded += 1
+        logging.info(f"Hang átkódolva: {os.path.basename(path)} -> {os.path.basename(cache_path)}")
+        return cache_path
+
+    def load(self, path):
+        cache_path = self.transcode(path)
+        if os.path.getsize(cache_path) == 0:
+            return pygame.mixer.Sound(buffer=b'')
+        # A pygame a puffert a saját memóriájába másolja; a leképezés a lemezolvasást és a dekódolást spórolja meg
+        with open(cache_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return pygame.mixer.Sound(buffer=mapped)
+
+    def transcode_all(self, directory):
+        threading.Thread(target=self._transcode_all_thread, args=(directory,), daemon=True).start()
+
+    def _transcode_all_thread(self, directory):
+        if not os.path.isdir(directory):
+            return
+        valid = set()
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            if not os.path.isfile(path) or not name.lower().endswith(('.mp3', '.wav', '.ogg')):
+                continue
+            if self.max_file_bytes is not None and os.path.getsize(path) >= self.max_file_bytes:
+                continue
+            try:
+                valid.add(os.path.basename(self.transcode(path)))
+            except Exception as e:
+                logging.error(f"Hiba a hang átkódolásakor ({path}): {e}")
+        # Már nem létező vagy más mixer formátumhoz tartozó átkódolt fájlok törlése
+        for name in os.listdir(self.cache_dir) if os.path.isdir(self.cache_dir) else []:
+            if name.endswith('.pcm') and name not in valid:
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except OSError as e:
+                    logging.error(f"Hiba az elavult átkódolt hang törlésekor ({name}): {e}")
+        logging.info(f"Hangkönyvtár átkódolva: {len(valid)} hang, {self.transcoded} új.")
+
+
+# Csengetésenkénti hangburkoló: felfutás és lecsengés másodpercben
+Envelope = collections.namedtuple('Envelope', ['attack', 'release'])
+
+
+def bell_envelope(bell):
+    envelope = Envelope(float(bell.get('attack', 0.0)), float(bell.get('release', 0.0)))
+    return envelope if envelope.attack > 0 or envelope.release > 0 else None
+
+
+def apply_envelope(sound, envelope):
+    # A burkoló a teljes mintatömbre egyszerre, vektorosan kerül rá
+    samples = pygame.sndarray.array(sound)
+    frequency = pygame.mixer.get_init()[0]
+    length = len(samples)
+    gain = np.ones(length, dtype=np.float32)
+    attack = min(int(envelope.attack * frequency), length)
+    release = min(int(envelope.release * frequency), length)
+    if attack:
+        gain[:attack] = np.linspace(0.0, 1.0, attack, endpoint=False, dtype=np.float32)
+    if release:
+        gain[length - release:] *= np.linspace(1.0, 0.0, release, dtype=np.float32)
+    shaped = samples * (gain[:, np.newaxis] if samples.ndim > 1 else gain)
+    return pygame.sndarray.make_sound(shaped.astype(samples.dtype))
+
+
+class SoundCache:
+    # Dekódolt (és burkolóval formázott) pygame.mixer.Sound objektumok LRU gyorsítótára memóriakorláttal
+    def __init__(self, max_bytes, pcm_cache=None):
+        self.max_bytes = max_bytes
+        self.pcm_cache = pcm_cache
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict() # (útvonal, burkoló) -> (Sound, méret bájtban, módosítási idő)
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _sound_size(sound):
+        # A get_raw() másolatot készítene, ezért a hosszból és a mixer formátumából számolunk
+        frequency, sample_format, channels = pygame.mixer.get_init()
+        return int(sound.get_length() * frequency) * channels * (abs(sample_format) // 8)
+
+    def get(self, path, envelope=None):
+        mtime = os.path.getmtime(path)
+        key = (path, envelope)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[2] == mtime:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        # A dekódolás a záron kívül fut, hogy a többi lejátszást ne tartsa fel
+        sound = self.load(path)
+        if envelope is not None:
+            sound = apply_envelope(sound, envelope)
+        size = self._sound_size(sound)
+        if size > self.max_bytes:
+            logging.info(f"A hang túl nagy a gyorsítótárhoz, nem tároljuk: {path} ({size // 1024} KB)")
+            return sound
+
+        with self.lock:
+            old_entry = self.entries.pop(key, None)
+            if old_entry is not None:
+                self.total_bytes -= old_entry[1]
+            self.entries[key] = (sound, size, mtime)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+                (evicted_path, _), (_, evicted_size, _) = self.entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+                logging.info(f"Hang kiürítve a gyorsítótárból: {evicted_path}")
+        return sound
+
+    def load(self, path):
+        # Dekódolás a gyorsítótár megkerülésével (pl. méréshez), burkoló nélkül
+        if self.pcm_cache is not None:
+            try:
+                return self.pcm_cache.load(path)
+            except (pygame.error, OSError) as e:
+                logging.error(f"Hiba az átkódolt hang betöltésekor, közvetlen dekódolás ({path}): {e}")
+        return pygame.mixer.Sound(path)
+
+    def prewarm(self, items):
+        # items: (útvonal, burkoló) párok
+        threading.Thread(target=self._prewarm_thread, args=(list(items),), daemon=True).start()
+
+    def _prewarm_thread(self, items):
+        for path, envelope in items:
+            try:
+                if os.path.exists(path):
+                    self.get(path, envelope)
+            except Exception as e:
+                logging.error(f"Hiba a hang előtöltésekor ({path}): {e}")
+        logging.info(f"Hang gyorsítótár előtöltve: {len(self.entries)} hang, {self.total_bytes // 1024} KB.")
+
+    def stats(self):
+        with self.lock:
+            return {'entries': len(self.entries), 'bytes': self.total_bytes, 'max_bytes': self.max_bytes,
+                    'hits': self.hits, 'misses': self.misses}
+
+
+class LoudnessAnalyzer:
+    # Hangfájlok integrált hangosságának és csúcsértékének mérése a háttérben, fájltartalom-hash szerint gyorsítótárazva.
+    # A mérés a BS.1770 kapuzott átlagát követi K-szűrő nélkül (400 ms-os blokkok, -70 dB abszolút és -10 dB relatív kapu).
+    BLOCK_SECONDS = 0.4
+    ABSOLUTE_GATE_DB = -70.0
+    RELATIVE_GATE_DB = -10.0
+
+    def __init__(self, sound_cache, cache_file=LOUDNESS_CACHE_FILE, target_db=-20.0):
+        self.sound_cache = sound_cache
+        self.cache_file = cache_file
+        self.target_db = target_db
+        self.lock = threading.Lock()
+        self.results = self._load() # hash -> {'loudness_db', 'peak_db'}
+        self.pending = set()
+
+    def _load(self):
+        if not os.path.exists(self.cache_file):
+            return {}
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            logging.error(f"Hiba a hangosság gyorsítótár betöltésekor: {e}")
+            return {}
+
+    def _save(self):
+        with self.lock:
+            data = dict(self.results)
+        temp_file = self.cache_file + '.tmp'
+        try:
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=4)
+            os.replace(temp_file, self.cache_file)
+        except OSError as e:
+            logging.error(f"Hiba a hangosság gyorsítótár mentésekor: {e}")
+
+    @classmethod
+    def measure(cls, samples, frequency):
+        # samples: (minták, csatornák) egész tömb; a mérés teljesen vektorosan fut
+        full_scale = float(np.iinfo(samples.dtype).max) + 1.0
+        data = samples.reshape(len(samples), -1).astype(np.float64) / full_scale
+        peak = float(np.max(np.abs(data))) if data.size else 0.0
+        block = int(frequency * cls.BLOCK_SECONDS)
+        block_count = len(data) // block
+        if block_count == 0:
+            block, block_count = len(data), 1 if len(data) else 0
+        if block_count == 0:
+            return {'loudness_db': cls.ABSOLUTE_GATE_DB, 'peak_db': cls.ABSOLUTE_GATE_DB}
+        # Blokkonkénti átlagos teljesítmény, a csatornák összegezve
+        power = np.square(data[:block * block_count]).reshape(block_count, block, -1).mean(axis=1).sum(axis=1)
+        with np.errstate(divide='ignore'):
+            block_db = 10.0 * np.log10(power)
+        gated = power[block_db > cls.ABSOLUTE_GATE_DB]
+        if gated.size == 0:
+            loudness_db = cls.ABSOLUTE_GATE_DB
+        else:
+            relative_gate = 10.0 * np.log10(gated.mean()) + cls.RELATIVE_GATE_DB
+            gated = gated[10.0 * np.log10(gated) > relative_gate]
+            loudness_db = float(10.0 * np.log10(gated.mean()))
+        peak_db = 20.0 * np.log10(peak) if peak > 0 else cls.ABSOLUTE_GATE_DB
+        return {'loudness_db': round(loudness_db, 2), 'peak_db': round(float(peak_db), 2)}
+
+    def analyze(self, paths):
+        with self.lock:
+            paths = [path for path in paths if path not in self.pending]
+            self.pending.update(paths)
+        if paths:
+            threading.Thread(target=self._analyze_thread, args=(paths,), daemon=True).start()
+
+    def _measure_file(self, path, file_hash):
+        # A nyers (burkoló nélküli) hangot mérjük, és nem tesszük az LRU-ba, hogy ne szorítsa ki a csengetések példányait
+        sound = self.sound_cache.load(path)
+        result = self.measure(pygame.sndarray.array(sound), pygame.mixer.get_init()[0])
+        with self.lock:
+            self.results[file_hash] = result
+        logging.info(f"Hangosság mérve: {os.path.basename(path)}: {result['loudness_db']} dB, csúcs {result['peak_db']} dBFS")
+        return result
+
+    def _analyze_thread(self, paths):
+        measured = 0
+        for path in paths:
+            try:
+                if not os.path.exists(path):
+                    continue
+                file_hash = file_sha1(path)
+                if file_hash in self.results:
+                    continue
+                self._measure_file(path, file_hash)
+                measured += 1
+            except Exception as e:
+                logging.error(f"Hiba a hangosság mérésekor ({path}): {e}")
+            finally:
+                with self.lock:
+                    self.pending.discard(path)
+        if measured:
+            self._save()
+
+    def gain(self, path):
+        # A normalizáló szorzó. Ez a lejátszás (vagy a UI) útján fut, ezért itt nem mérünk: a még nem mért fájl
+        # 1.0-t kap, a mérés a háttérben indul. Az ütemezett hangokat a prewarm már előre lemérte.
+        # A csatorna hangereje nem lehet 1.0 fölött, így a halk fájlokat nem erősítjük, a hangosakat halkítjuk.
+        try:
+            result = self.results.get(file_sha1(path))
+        except OSError:
+            return 1.0
+        if result is None:
+            self.analyze([path])
+            return 1.0
+        gain_db = min(self.target_db - result['loudness_db'], -result['peak_db'], 0.0)
+        return 10.0 ** (gain_db / 20.0)
+
+
+class AudioService:
+    # Egyetlen, hosszú életű hangszolgáltatás szál. A lejátszás végét a hang hosszából számolt
+    # határidő jelzi (a pygame.event a wx mellett nem használható videó alrendszer nélkül),
+    # nem lejátszásonkénti 100 ms-os get_busy lekérdezés.
+    END_GRACE = 0.02 # Ha a határidőkor a csatorna még szól, ennyit várunk újra
+
+    def __init__(self, on_finished):
+        self.on_finished = on_finished
+        self.commands = queue.Queue()
+        self.active = {} # lejátszás azonosító -> (határidő monoton időben, csatorna)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def watch(self, token, channel, length):
+        self.commands.put(('watch', token, channel, time.monotonic() + length))
+
+    def cancel(self, token):
+        self.commands.put(('cancel', token))
+
+    def shutdown(self):
+        self.commands.put(('shutdown',))
+        self.thread.join(timeout=1)
+
+    def _run(self):
+        logging.info("Hangszolgáltatás szál elindult.")
+        while True:
+            timeout = None
+            if self.active:
+                timeout = max(0.0, min(deadline for deadline, _ in self.active.values()) - time.monotonic())
+            try:
+                command = self.commands.get(timeout=timeout)
+            except queue.Empty:
+                command = None
+
+            if command is not None:
+                if command[0] == 'shutdown':
+                    break
+                if command[0] == 'watch':
+                    _, token, channel, deadline = command
+                    self.active[token] = (deadline, channel)
+                elif command[0] == 'cancel':
+                    self.active.pop(command[1], None)
+
+            now = time.monotonic()
+            for token, (deadline, channel) in list(self.active.items()):
+                if deadline > now:
+                    continue
+                try:
+                    busy = channel.get_busy()
+                except pygame.error:
+                    busy = False
+                if busy:
+                    self.active[token] = (now + self.END_GRACE, channel)
+                    continue
+                del self.active[token]
+                try:
+                    self.on_finished(token)
+                except Exception as e:
+                    logging.error(f"Hiba a lejátszás befejezésének kezelésekor: {e}")
+        logging.info("Hangszolgáltatás szál leállt.")
+
+
+def _pcm_to_float(frames, sample_width, channels):
+    # WAV keret bájtok -> (minták, csatornák) float32 tömb a [-1, 1) tartományban
+    if sample_width == 1:
+        data = (np.frombuffer(frames, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif sample_width == 3:
+        raw = np.frombuffer(frames, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        data = (((raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)) << 8) >> 8).astype(np.float32) / float(1 << 23)
+    else:
+        dtype = {2: np.int16, 4: np.int32}[sample_width]
+        data = np.frombuffer(frames, dtype=dtype).astype(np.float32) / float(np.iinfo(dtype).max + 1)
+    return data.reshape(-1, channels)
+
+
+def _float_to_mixer(data):
+    # float32 (minták, csatornák) -> a mixer formátumának megfelelő nyers bájtok
+    _, sample_format, channels = pygame.mixer.get_init()
+    if channels == 1 and data.shape[1] > 1:
+        data = data.mean(axis=1, keepdims=True)
+    elif data.shape[1] == 1 and channels > 1:
+        data = np.repeat(data, channels, axis=1)
+    elif data.shape[1] > channels:
+        data = data[:, :channels]
+    data = np.clip(data, -1.0, 1.0)
+    if sample_format == 32:
+        return data.astype(np.float32).tobytes()
+    bits = abs(sample_format)
+    if sample_format < 0:
+        dtype = {8: np.int8, 16: np.int16, 32: np.int32}[bits]
+        return (data * np.iinfo(dtype).max).astype(dtype).tobytes()
+    dtype = {8: np.uint8, 16: np.uint16}[bits]
+    return ((data + 1.0) * (np.iinfo(dtype).max / 2.0)).astype(dtype).tobytes()
+
+
+class WavStream:
+    # Hosszú WAV fájl lejátszása fix méretű darabokban: olvasás, átalakítás a mixer formátumára
+    # és sorba állítás a csatornán, legfeljebb ring_chunks darabos pufferrel, így a memória a fájl hosszától független.
+    # A csatornához hasonló felületet ad (set_volume, stop, fadeout), így a zóna-nyilvántartás ugyanúgy kezeli.
+    def __init__(self, path, channel, on_finished, chunk_seconds=0.5, ring_chunks=4):
+        self.path = path
+        self.channel = channel
+        self.on_finished = on_finished
+        self.chunk_seconds = chunk_seconds
+        self.ring_chunks = ring_chunks
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.wav = wave.open(path, 'rb')
+        self.source_rate = self.wav.getframerate()
+        self.chunk_frames = max(1, int(self.source_rate * chunk_seconds))
+        self.tail = None # Az előző darab utolsó mintája az átmintavételezés folytonosságához
+        self.phase = 0.0
+        self.underruns = 0
+
+    def _read_chunk(self):
+        frames = self.wav.readframes(self.chunk_frames)
+        if not frames:
+            return None
+        data = _pcm_to_float(frames, self.wav.getsampwidth(), self.wav.getnchannels())
+        target_rate = pygame.mixer.get_init()[0]
+        if self.source_rate != target_rate:
+            # Lineáris átmintavételezés, a darabhatáron átvitt fázissal
+            if self.tail is not None:
+                data = np.vstack([self.tail, data])
+            step = self.source_rate / target_rate
+            positions = np.arange(self.phase, len(data) - 1, step)
+            if len(positions):
+                self.phase = positions[-1] + step - (len(data) - 1)
+            source_index = np.arange(len(data))
+            self.tail = data[-1:]
+            data = np.stack([np.interp(positions, source_index, data[:, c]) for c in range(data.shape[1])], axis=1)
+        return pygame.mixer.Sound(buffer=_float_to_mixer(data))
+
+    def play(self, token):
+        # Az első darab a hívó szálában indul, hogy a késés ne függjön a szál indulásától
+        self.token = token
+        first = self._read_chunk()
+        if first is None:
+            raise pygame.error(f"Üres hangfájl: {self.path}")
+        self.channel.play(first)
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        ring = collections.deque()
+        eof = False
+        try:
+            while not self.stop_event.is_set():
+                while not eof and len(ring) < self.ring_chunks:
+                    chunk = self._read_chunk()
+                    if chunk is None:
+                        eof = True
+                    else:
+                        ring.append(chunk)
+                with self.lock:
+                    if self.stop_event.is_set():
+                        break
+                    busy = self.channel.get_busy()
+                    if ring and not busy:
+                        self.underruns += 1
+                        logging.warning(f"Streamelési alulcsordulás: {os.path.basename(self.path)}")
+                        self.channel.play(ring.popleft())
+                    elif ring and self.channel.get_queue() is None:
+                        self.channel.queue(ring.popleft())
+                    elif not ring and not busy:
+                        break
+                self.stop_event.wait(self.chunk_seconds / 4)
+        except (wave.Error, OSError, pygame.error) as e:
+            logging.error(f"Hiba a streamelt lejátszás közben ({self.path}): {e}")
+        finally:
+            self.wav.close()
+        if not self.stop_event.is_set():
+            self.on_finished(self.token)
+
+    def set_volume(self, volume):
+        self.channel.set_volume(volume)
+
+    def stop(self):
+        with self.lock:
+            self.stop_event.set()
+            self.channel.stop()
+
+    def fadeout(self, milliseconds):
+        with self.lock:
+            self.stop_event.set()
+            self.channel.fadeout(milliseconds)
+
+
+class MusicStream:
+    # Tömörített (MP3/OGG) hosszú fájlok: a pygame.mixer.music maga olvassa és dekódolja darabonként a lemezről.
+    # Egyszerre csak egy ilyen szólhat; a végét ritka lekérdezéssel figyeljük, mert a zene nem mixer csatornán szól.
+    POLL_INTERVAL = 0.25
+
+    def __init__(self, path, on_finished):
+        self.path = path
+        self.on_finished = on_finished
+        self.stop_event = threading.Event()
+
+    def play(self, token):
+        self.token = token
+        pygame.mixer.music.load(self.path)
+        pygame.mixer.music.play()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        while not self.stop_event.wait(self.POLL_INTERVAL):
+            if not pygame.mixer.music.get_busy():
+                self.on_finished(self.token)
+                return
+
+    def set_volume(self, volume):
+        pygame.mixer.music.set_volume(volume)
+
+    def stop(self):
+        self.stop_event.set()
+        pygame.mixer.music.stop()
+
+    def fadeout(self, milliseconds):
+        self.stop_event.set()
+        pygame.mixer.music.fadeout(milliseconds)
+
+
+# Beépített hangok: a csengetés 'tone' mezője ezek egyikének paramétereit tartalmazza
+TONE_PRESETS = {
+    "Gong": {'type': 'chime', 'frequencies': [659.25, 523.25, 587.33, 392.0], 'note_seconds': 0.7},
+    "Sípolás": {'type': 'beep', 'frequency': 1000.0, 'count': 3, 'on_seconds': 0.25, 'off_seconds': 0.15},
+    "Sziréna": {'type': 'siren', 'low': 600.0, 'high': 1200.0, 'sweep_seconds': 1.0, 'duration': 4.0},
+}
+# Hiányzó hangfájl esetén ez szól
+FALLBACK_TONE = TONE_PRESETS["Gong"]
+
+
+def render_tone(tone):
+    # A hang teljes mintatömbje egyszerre, vektorosan számolva (mono float32)
+    frequency = pygame.mixer.get_init()[0]
+    tone_type = tone.get('type', 'chime')
+    if tone_type == 'chime':
+        notes = np.asarray(tone.get('frequencies', [880.0]), dtype=np.float32)
+        note_length = int(tone.get('note_seconds', 0.7) * frequency)
+        t = np.arange(note_length, dtype=np.float32) / frequency
+        decay = np.exp(-4.0 * t / max(tone.get('note_seconds', 0.7), 0.01))
+        # Alaphang és két felhang, hangonként lecsengő, egymás után
+        phase = 2.0 * np.pi * notes[:, np.newaxis] * t
+        data = (np.sin(phase) + 0.4 * np.sin(2.0 * phase) + 0.2 * np.sin(3.0 * phase)) * decay / 1.6
+        data = data.reshape(-1)
+    elif tone_type == 'beep':
+        on_length = int(tone.get('on_seconds', 0.25) * frequency)
+        off_length = int(tone.get('off_seconds', 0.15) * frequency)
+        t = np.arange(on_length, dtype=np.float32) / frequency
+        beep = np.sin(2.0 * np.pi * tone.get('frequency', 1000.0) * t)
+        cycle = np.concatenate([beep, np.zeros(off_length, dtype=np.float32)])
+        data = np.tile(cycle, int(tone.get('count', 3)))
+    elif tone_type == 'siren':
+        t = np.arange(int(tone.get('duration', 4.0) * frequency), dtype=np.float32) / frequency
+        low, high = tone.get('low', 600.0), tone.get('high', 1200.0)
+        sweep = tone.get('sweep_seconds', 1.0)
+        # Háromszög alakú frekvenciamenet; a fázis a pillanatnyi frekvencia összegzése
+        position = np.abs((t / sweep) % 2.0 - 1.0)
+        instantaneous = high - (high - low) * position
+        data = np.sin(2.0 * np.pi * np.cumsum(instantaneous) / frequency)
+    else:
+        raise ValueError(f"Ismeretlen hangtípus: {tone_type}")
+    return (0.8 * data).astype(np.float32)
+
+
+class ToneCache:
+    # A beépített hangok paramétereik hash-e (és a burkoló) szerint gyorsítótárazva; nincs fájl I/O
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}
+
+    @staticmethod
+    def tone_key(tone):
+        return hashlib.sha1(json.dumps(dict(tone), sort_keys=True).encode('utf-8')).hexdigest()
+
+    def get(self, tone, envelope=None):
+        key = (self.tone_key(tone), envelope)
+        with self.lock:
+            sound = self.entries.get(key)
+        if sound is not None:
+            return sound
+        sound = pygame.mixer.Sound(buffer=_float_to_mixer(render_tone(tone)[:, np.newaxis]))
+        if envelope is not None:
+            sound = apply_envelope(sound, envelope)
+        with self.lock:
+            self.entries[key] = sound
+        return sound
+
+    def prewarm(self, items):
+        threading.Thread(target=self._prewarm_thread, args=(list(items),), daemon=True).start()
+
+    def _prewarm_thread(self, items):
+        for tone, envelope in items:
+            try:
+                self.get(tone, envelope)
+            except (ValueError, pygame.error) as e:
+                logging.error(f"Hiba a beépített hang előállításakor: {e}")
+
+
+# Pre-roll által előkészített, lejátszásra kész hang
+# ramp: leállításkor ennyi mp alatt halkul el a hang; sound=None: streamelt lejátszás
+PreparedSound = collections.namedtuple('PreparedSound', ['sound_file', 'sound', 'volume', 'ramp'], defaults=(0.0,))
+
+
+# Egy zóna éppen szóló hangja
+# channel_id: a lefoglalt keverő csatorna sorszáma (a közös zene lejátszónál None)
+ZonePlayback = collections.namedtuple('ZonePlayback', ['token', 'channel', 'priority', 'sound_file', 'volume', 'ramp', 'channel_id'])
+
+
 class BellPlayer:
     def __init__(self, main_frame):
         self.main_frame = main_frame
-        self.is_playing = False
-        self.stop_requested = False
-        self.current_sound_file = None
-        self.player_thread = None
+        self.playback_id = 0
+        # Zónánként egy aktív lejátszás: zóna -> ZonePlayback
+        self.zone_playbacks = {}
+        self.lock = threading.RLock() # A lejátszási állapotot a UI, az ellenőrző és a hangszolgáltatás szál is írja
+        self.audio_service = AudioService(self._on_playback_finished)
+        # Ütemezett időpont -> lejátszás indulása késés
+        self.latency = LatencyHistogram()
+        cache_mb = main_frame.settings_manager.get_setting('sound_cache_mb', 64)
+        self.stream_threshold = int(main_frame.settings_manager.get_setting('stream_threshold_mb', 8) * 1024 * 1024)
+        self.pcm_cache = PCMCache(max_file_bytes=self.stream_threshold)
+        self.sound_cache = SoundCache(int(cache_mb * 1024 * 1024), self.pcm_cache)
+        self.tone_cache = ToneCache()
+        # Vészjelzés: fenntartott csatorna és mindig memóriában tartott hang
+        self.alarm_channel = None
+        self.alarm_sound = None
+        self.alarm_active = False
+        self.alarm_latency = LatencyHistogram()
+        self.loudness = LoudnessAnalyzer(self.sound_cache,
+                                         target_db=main_frame.settings_manager.get_setting('target_loudness_db', -20.0))
+        # Zónánkénti hangerő (0-100), a csengetés saját hangerejével szorzódik
+        self.duck_gain = 1.0 # Keverő szintű ducking szorzója (MixerVolumeBackend)
+        self.zone_volumes = {zone: config.get('volume', 100)
+                             for zone, config in main_frame.settings_manager.get_setting('zones', {}).items()}
 
         try:
-            pygame.mixer.init()
-            logging.info("Pygame mixer inicializálva.")
+            # Nagyobb puffer: több egyidejű zóna keverése se akadjon meg
+            pygame.mixer.init(buffer=main_frame.settings_manager.get_setting('mixer_buffer', 2048))
+            pygame.mixer.set_num_channels(main_frame.settings_manager.get_setting('mixer_channels', 16))
+            logging.info(f"Pygame mixer inicializálva, {pygame.mixer.get_num_channels()} csatorna.")
+            self.pcm_cache.transcode_all('hangok')
+            pygame.mixer.set_reserved(1)
+            self.alarm_channel = pygame.mixer.Channel(0) # Csak a vészjelzésé
+            # A sziréna előállításához a NumPy kell; az indulást nem tartjuk fel vele
+            threading.Thread(target=self.load_alarm_sound, daemon=True).start()
         except Exception as e:
             logging.error(f"Hiba a Pygame mixer inicializálásakor: {e}")
 
-    def play_sound(self, sound_file, volume):
+    @property
+    def is_playing(self):
+        return bool(self.zone_playbacks)
+
+    @property
+    def current_sound_file(self):
+        playbacks = list(self.zone_playbacks.values())
+        return playbacks[-1].sound_file if playbacks else None
+
+    def get_latency_stats(self):
+        return self.latency.summary()
+
+    def get_alarm_latency_stats(self):
+        stats = self.alarm_latency.summary()
+        # A mért késéshez a keverő puffer kiürülése még hozzáadódik
+        init = pygame.mixer.get_init()
+        if init:
+            stats['mixer_buffer_ms'] = round(1000.0 * self.main_frame.settings_manager.get_setting('mixer_buffer', 2048) / init[0], 1)
+        return stats
+
+    def load_alarm_sound(self):
+        settings = self.main_frame.settings_manager
+        alarm_file = settings.get_setting('alarm_sound', '')
+        try:
+            full_sound_path = os.path.join('hangok', alarm_file)
+            if alarm_file and os.path.exists(full_sound_path) and not self.is_streamed(full_sound_path):
+                self.alarm_sound = self.sound_cache.get(full_sound_path)
+            else:
+                self.alarm_sound = self.tone_cache.get(TONE_PRESETS["Sziréna"])
+        except (pygame.error, ValueError) as e:
+            logging.error(f"Hiba a vészjelzés hangjának betöltésekor: {e}")
+            self.alarm_sound = self.tone_cache.get(TONE_PRESETS["Sziréna"])
+        logging.info(f"Vészjelzés hang előtöltve ({round(self.alarm_sound.get_length(), 1)} mp).")
+
+    def trigger_alarm(self, triggered_at=None):
+        # A fenntartott csatornán azonnal, zár nélkül indul; csak utána némítjuk a többi zónát
+        triggered_at = time.monotonic() if triggered_at is None else triggered_at
+        if self.alarm_channel is None:
+            logging.error("A vészjelzés nem indítható: a mixer nincs inicializálva.")
+            return
+        if self.alarm_sound is None:
+            # Közvetlenül indítás után a háttérbetöltés még tarthat
+            self.load_alarm_sound()
+        self.alarm_channel.set_volume(self.main_frame.settings_manager.get_setting('alarm_volume', 100) / 100.0)
+        self.alarm_channel.play(self.alarm_sound, loops=-1)
+        self.alarm_latency.record(time.monotonic() - triggered_at)
+        self.alarm_active = True
+        with self.lock:
+            for zone in list(self.zone_playbacks):
+                self._stop_playback(zone)
+        logging.warning("VÉSZJELZÉS elindítva.")
+        wx.CallAfter(self.main_frame.show_status_message, "VÉSZJELZÉS!")
+
+    def stop_alarm(self):
+        if not self.alarm_active:
+            return
+        self.alarm_active = False
+        if self.alarm_channel is not None:
+            self.alarm_channel.stop()
+        logging.warning("Vészjelzés leállítva.")
+        wx.CallAfter(self.main_frame.show_status_message, "Vészjelzés leállítva.")
+
+    def prewarm(self, items):
+        # Az aktív ütemezés hangjainak dekódolása és burkolása a háttérben, hogy csengetéskor ne a lemezről töltsünk.
+        # items: (útvonal, burkoló) párok; a streamelt fájlok kimaradnak
+        items = [(path, envelope) for path, envelope in items if not self.is_streamed(path)]
+        if pygame.mixer.get_init():
+            self.sound_cache.prewarm(items)
+            if self.main_frame.settings_manager.get_setting('loudness_normalization', False):
+                self.loudness.analyze(sorted({path for path, _ in items}))
+
+    def is_streamed(self, sound_file):
+        try:
+            return os.path.getsize(sound_file) >= self.stream_threshold
+        except OSError:
+            return False
+
+    def prepare(self, sound_file, volume, envelope=None, ramp=0.0):
+        # Előkészítés (pre-roll): útvonal ellenőrzés, dekódolás a memóriába és a hangerő kiszámítása.
+        # Esedékességkor már csak a lejátszás indítása marad.
+        if not pygame.mixer.get_init():
+            logging.error("Pygame mixer nincs inicializálva. A hang előkészítése sikertelen.")
+            return None
+        if not os.path.exists(sound_file):
+            logging.error(f"A hangfájl nem található: {sound_file}")
+            wx.CallAfter(self.main_frame.show_status_message, f"Hiba: A hangfájl nem található: {os.path.basename(sound_file)}")
+            return None
+        if self.is_streamed(sound_file):
+            # Nagy fájl: nem kerül a gyorsítótárba, lejátszáskor darabonként olvassuk
+            return PreparedSound(sound_file, None, volume / 100.0, ramp)
+        try:
+            sound = self.sound_cache.get(sound_file, envelope)
+        except pygame.error as e:
+            logging.error(f"Hiba a hang betöltésekor: {e}")
+            wx.CallAfter(self.main_frame.show_status_message, f"Hiba a hang betöltésekor: {e}")
+            return None
+        gain = 1.0
+        if self.main_frame.settings_manager.get_setting('loudness_normalization', False):
+            gain = self.loudness.gain(sound_file)
+        return PreparedSound(sound_file, sound, volume / 100.0 * gain, ramp)
+
+    def prepare_tone(self, tone, volume, envelope=None, ramp=0.0):
+        if not pygame.mixer.get_init():
+            logging.error("Pygame mixer nincs inicializálva. A hang előkészítése sikertelen.")
+            return None
+        try:
+            sound = self.tone_cache.get(tone, envelope)
+        except (ValueError, pygame.error) as e:
+            logging.error(f"Hiba a beépített hang előállításakor: {e}")
+            return None
+        return PreparedSound(f"hang:{tone.get('type', 'chime')}", sound, volume / 100.0, ramp)
+
+    def prepare_bell(self, bell):
+        # A csengetés hangja: hangfájl, beépített hang, vagy hiányzó fájl esetén a tartalék gong
+        volume = bell.get('volume', 50)
+        envelope = bell_envelope(bell)
+        ramp = bell.get('ramp', 0.0)
+        sound_file = bell.get('sound_file')
+        if sound_file:
+            full_sound_path = os.path.join('hangok', sound_file)
+            if os.path.exists(full_sound_path):
+                return self.prepare(full_sound_path, volume, envelope, ramp)
+            logging.warning(f"A hangfájl nem található, tartalék hang szól: {full_sound_path}")
+        return self.prepare_tone(bell.get('tone') or FALLBACK_TONE, volume, envelope, ramp)
+
+    def prewarm_tones(self, items):
+        # items: (hang paraméterek, burkoló) párok
+        if pygame.mixer.get_init():
+            self.tone_cache.prewarm(items)
+
+    def play_sound(self, sound_file, volume, scheduled_time=None, zone=DEFAULT_ZONE, priority=0, envelope=None, ramp=0.0):
         if not pygame.mixer.get_init():
             logging.error("Pygame mixer nincs inicializálva. A hang lejátszása sikertelen.")
             self.main_frame.show_status_message("Hiba: Hang lejátszás nem lehetséges (mixer hiba).")
             return
 
-        if self.is_playing:
-            self.stop_sound()
-            time.sleep(0.1) # Várjunk egy kicsit, hogy a stop végrehajtódjon
+        prepared = self.prepare(sound_file, volume, envelope, ramp)
+        if prepared is not None:
+            self.play_prepared(prepared, scheduled_time, zone, priority)
 
-        self.stop_requested = False
-        self.current_sound_file = sound_file
+    def _channel_volume(self, volume, zone):
+        return volume * self.zone_volumes.get(zone, 100) / 100.0 * self.duck_gain
 
-        self.player_thread = threading.Thread(target=self._play_sound_thread, args=(sound_file, volume), daemon=True)
-        self.player_thread.start()
+    def set_duck_gain(self, gain):
+        # Keverő szintű ducking: minden szóló zóna hangereje azonnal, a vészjelzésé nem
+        with self.lock:
+            self.duck_gain = gain
+            for zone, playback in self.zone_playbacks.items():
+                playback.channel.set_volume(self._channel_volume(playback.volume, zone))
 
-    def _play_sound_thread(self, sound_file, volume):
-        if not os.path.exists(sound_file):
-            logging.error(f"A hangfájl nem található: {sound_file}")
-            wx.CallAfter(self.main_frame.show_status_message, f"Hiba: A hangfájl nem található: {os.path.basename(sound_file)}")
-            self.is_playing = False
+    def set_zone_volume(self, zone, volume):
+        with self.lock:
+            self.zone_volumes[zone] = volume
+            playback = self.zone_playbacks.get(zone)
+            if playback is not None:
+                playback.channel.set_volume(self._channel_volume(playback.volume, zone))
+
+    def _free_channel(self):
+        # A find_channel a fenntartott (vészjelzés) csatornát is visszaadhatja, ezért a többiek közül keresünk.
+        # A zónához még hozzárendelt csatorna akkor sem szabad, ha épp csendes: a hang vége és a befejezés
+        # jelzése között, illetve a stream darabjai közti szünetben a get_busy() már False.
+        owned = {playback.channel_id for playback in self.zone_playbacks.values()}
+        for channel_id in range(1, pygame.mixer.get_num_channels()):
+            if channel_id in owned:
+                continue
+            channel = pygame.mixer.Channel(channel_id)
+            if not channel.get_busy():
+                return channel_id, channel
+        return None, None
+
+    def _claim_channel(self, zone, priority):
+        # Elsőbbségi szabályok: a zónán belül az azonos vagy magasabb prioritás lecseréli az aktuálisat,
+        # az alacsonyabb elmarad. Ha nincs szabad csatorna, a legalacsonyabb prioritású más zónát szorítjuk ki.
+        current = self.zone_playbacks.get(zone)
+        if current is not None:
+            if priority < current.priority:
+                logging.info(f"Csengetés elmarad a(z) {zone} zónában: magasabb prioritású hang szól.")
+                return None, None
+            self._stop_playback(zone)
+        channel_id, channel = self._free_channel()
+        if channel is not None:
+            return channel_id, channel
+        victims = sorted(((z, playback) for z, playback in self.zone_playbacks.items()
+                          if not isinstance(playback.channel, MusicStream)), key=lambda item: item[1].priority)
+        if victims and victims[0][1].priority <= priority:
+            victim_zone = victims[0][0]
+            logging.warning(f"Nincs szabad csatorna, a(z) {victim_zone} zóna lejátszása megszakítva.")
+            self._stop_playback(victim_zone)
+            return self._free_channel()
+        logging.warning(f"Nincs szabad csatorna, a(z) {zone} zóna csengetése elmarad.")
+        return None, None
+
+    def _claim_stream(self, sound_file, zone, priority):
+        if sound_file.lower().endswith('.wav'):
+            channel_id, channel = self._claim_channel(zone, priority)
+            if channel is None:
+                return None, None
+            settings = self.main_frame.settings_manager
+            return channel_id, WavStream(sound_file, channel, self._on_playback_finished,
+                                         settings.get_setting('stream_chunk_seconds', 0.5),
+                                         settings.get_setting('stream_ring_chunks', 4))
+        # A zene lejátszó közös: egy másik zóna zenéje csak azonos vagy alacsonyabb prioritás esetén szakítható meg
+        music_zone = next((z for z, playback in self.zone_playbacks.items()
+                           if isinstance(playback.channel, MusicStream) and z != zone), None)
+        if music_zone is not None:
+            if priority < self.zone_playbacks[music_zone].priority:
+                logging.info(f"Streamelt lejátszás elmarad a(z) {zone} zónában: a(z) {music_zone} zóna zenéje szól.")
+                return None, None
+            self._stop_playback(music_zone)
+        current = self.zone_playbacks.get(zone)
+        if current is not None:
+            if priority < current.priority:
+                logging.info(f"Csengetés elmarad a(z) {zone} zónában: magasabb prioritású hang szól.")
+                return None, None
+            self._stop_playback(zone)
+        return None, MusicStream(sound_file, self._on_playback_finished)
+
+    def play_prepared(self, prepared, scheduled_time=None, zone=DEFAULT_ZONE, priority=0):
+        if self.alarm_active:
+            logging.info(f"Csengetés elmarad vészjelzés alatt: {prepared.sound_file}")
             return
+        with self.lock:
+            try:
+                if prepared.sound is None:
+                    channel_id, channel = self._claim_stream(prepared.sound_file, zone, priority)
+                else:
+                    channel_id, channel = self._claim_channel(zone, priority)
+                if channel is None:
+                    return
+                channel.set_volume(self._channel_volume(prepared.volume, zone))
+                channel.play(self.playback_id + 1 if prepared.sound is None else prepared.sound)
+                if scheduled_time is not None:
+                    self.latency.record(time.time() - scheduled_time)
+            except (pygame.error, wave.Error, OSError) as e:
+                logging.error(f"Hiba a Pygame hang lejátszásakor: {e}")
+                wx.CallAfter(self.main_frame.show_status_message, f"Hiba a hang lejátszásakor: {e}")
+                return
+
+            self.playback_id += 1
+            self.zone_playbacks[zone] = ZonePlayback(self.playback_id, channel, priority, prepared.sound_file,
+                                                     prepared.volume, prepared.ramp, channel_id)
+            if prepared.sound is not None:
+                # A streamelt lejátszás végét a saját szála jelzi
+                self.audio_service.watch(self.playback_id, channel, prepared.sound.get_length())
+        logging.info(f"Hang lejátszása indult: {prepared.sound_file}, hangerő: {round(prepared.volume * 100)}, zóna: {zone}")
+        wx.CallAfter(self.main_frame.show_status_message, f"Csengetés szól: {os.path.basename(prepared.sound_file)}")
+
+    def _on_playback_finished(self, token):
+        # A hangszolgáltatás (vagy a stream) szálából hívódik; egy azóta leállított/lecserélt lejátszás nem számít
+        with self.lock:
+            zone = next((zone for zone, playback in self.zone_playbacks.items() if playback.token == token), None)
+            if zone is None:
+                return
+            del self.zone_playbacks[zone]
+        logging.info(f"Hang lejátszás befejeződött (zóna: {zone}).")
+        wx.CallAfter(self.main_frame.show_status_message, "Csengetés befejeződött.")
+        wx.PostEvent(self.main_frame, BellFinishedPlayingEvent())
+
+    def _stop_playback(self, zone, fade=False):
+        playback = self.zone_playbacks.pop(zone)
+        # A csatorna leállítása azonnali (vagy a mixer halkítja el), nem kell szálra várni
+        try:
+            if fade and playback.ramp > 0:
+                playback.channel.fadeout(int(playback.ramp * 1000))
+            else:
+                playback.channel.stop()
+        except pygame.error as e:
+            logging.error(f"Hiba a hang leállításakor: {e}")
+        self.audio_service.cancel(playback.token)
+
+    def stop_sound(self, zone=None):
+        # zone=None: minden zóna leállítása
+        with self.lock:
+            zones = [zone] if zone is not None else list(self.zone_playbacks)
+            zones = [z for z in zones if z in self.zone_playbacks]
+            if not zones:
+                return
+            for z in zones:
+                self._stop_playback(z, fade=True)
+        logging.info("Hang lejátszás leállítva.")
+        wx.CallAfter(self.main_frame.show_status_message, "Csengetés leállítva.")
+
+    def shutdown(self):
+        self.stop_alarm()
+        with self.lock:
+            for zone in list(self.zone_playbacks):
+                self._stop_playback(zone)
+        self.audio_service.shutdown()
+
+class AlarmServer:
+    # Helyi (csak 127.0.0.1) parancsfogadó a vészjelzéshez: soronként egy parancs (ALARM, STOP, STATUS).
+    # A riasztás közvetlenül ebből a szálból indul, nem vár a wx eseménykezelőre.
+    def __init__(self, main_frame, port=ALARM_PORT):
+        self.main_frame = main_frame
+        self.port = port
+        self.server_socket = None
+        self.thread = None
 
+    def start(self):
         try:
-            pygame.mixer.music.load(sound_file)
-            pygame.mixer.music.set_volume(volume / 100.0)
-            pygame.mixer.music.play()
-            self.is_playing = True
-            logging.info(f"Hang lejátszása indult: {sound_file}, hangerő: {volume}")
-            wx.CallAfter(self.main_frame.show_status_message, f"Csengetés szól: {os.path.basename(sound_file)}")
-
-            while pygame.mixer.music.get_busy() and not self.stop_requested:
-                time.sleep(0.1)
-
-            pygame.mixer.music.stop()
-            pygame.mixer.music.unload()
-            self.is_playing = False
-            self.current_sound_file = None
-            logging.info("Hang lejátszás befejeződött.")
-            wx.CallAfter(self.main_frame.show_status_message, "Csengetés befejeződött.")
-            wx.PostEvent(self.main_frame, BellFinishedPlayingEvent())
+            self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.server_socket.bind(('127.0.0.1', self.port))
+            self.server_socket.listen(4)
+        except OSError as e:
+            logging.error(f"A vészjelzés parancsfogadó nem indítható a(z) {self.port} porton: {e}")
+            self.server_socket = None
+            return
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+        logging.info(f"Vészjelzés parancsfogadó fut: 127.0.0.1:{self.port}")
 
-        except pygame.error as e:
-            logging.error(f"Hiba a Pygame hang lejátszásakor: {e}")
-            wx.CallAfter(self.main_frame.show_status_message, f"Hiba a hang lejátszásakor: {e}")
-            self.is_playing = False
+    def stop(self):
+        if self.server_socket is not None:
+            self.server_socket.close()
+            self.server_socket = None
+
+    def _serve(self):
+        while self.server_socket is not None:
+            try:
+                connection, _ = self.server_socket.accept()
+            except OSError:
+                break
+            with connection:
+                try:
+                    connection.settimeout(2.0)
+                    command = connection.makefile('r', encoding='utf-8').readline().strip().upper()
+                    connection.sendall((self.handle_command(command, time.monotonic()) + '\n').encode('utf-8'))
+                except OSError as e:
+                    logging.error(f"Hiba a vészjelzés parancs fogadásakor: {e}")
+
+    def handle_command(self, command, received_at):
+        bell_player = self.main_frame.bell_player
+        if command == 'ALARM':
+            bell_player.trigger_alarm(received_at)
+            wx.CallAfter(self.main_frame.on_alarm_state_changed)
+            return 'OK'
+        if command == 'STOP':
+            bell_player.stop_alarm()
+            wx.CallAfter(self.main_frame.on_alarm_state_changed)
+            return 'OK'
+        if command == 'STATUS':
+            return json.dumps({'alarm_active': bell_player.alarm_active, 'latency': bell_player.get_alarm_latency_stats(),
+                               'bells': self.main_frame.bell_checker.get_stats()})
+        return 'ERROR ismeretlen parancs'
+
+
+def send_alarm_command(command, port=ALARM_PORT):
+    # Parancssori vezérlés: a futó alkalmazás helyi parancsfogadójának küld egy parancsot
+    with socket.create_connection(('127.0.0.1', port), timeout=2.0) as connection:
+        connection.sendall((command + '\n').encode('utf-8'))
+        return connection.makefile('r', encoding='utf-8').readline().strip()
+
+
+class FireLedger:
+    # Lemezre mentett napló a már megszólalt előfordulásokról: (csengetés id, előfordulás időbélyeg)
+    def __init__(self, ledger_file=FIRE_LEDGER_FILE, retention=2 * 24 * 3600):
+        self.ledger_file = ledger_file
+        self.retention = retention
+        self.lock = threading.Lock()
+        self.entries = self._load()
+        # A mentés a csengető szálon kívül, közvetlenül a foglalás után fut, hogy a lemezírás ne késleltesse a lejátszást
+        self.writer = DebouncedWriter(self._save, delay=0)
+
+    def _load(self):
+        entries = {}
+        if os.path.exists(self.ledger_file):
+            try:
+                with open(self.ledger_file, 'r', encoding='utf-8') as f:
+                    for key, fired_at in json.load(f).items():
+                        bell_id, occurrence = key.split('@')
+                        entries[(int(bell_id), int(occurrence))] = fired_at
+                logging.info(f"Csengetési napló betöltve: {len(entries)} bejegyzés.")
+            except Exception as e:
+                logging.error(f"Hiba a csengetési napló betöltésekor: {e}")
+        return entries
+
+    def _save(self):
+        # Ideiglenes fájlba írunk és cserélünk, hogy összeomláskor se sérüljön a napló
+        with self.lock:
+            data = {f"{bell_id}@{occurrence}": fired_at for (bell_id, occurrence), fired_at in self.entries.items()}
+        temp_file = self.ledger_file + '.tmp'
+        try:
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(temp_file, self.ledger_file)
         except Exception as e:
-            logging.error(f"Ismeretlen hiba a hang lejátszásakor: {e}")
-            wx.CallAfter(self.main_frame.show_status_message, f"Ismeretlen hiba a hang lejátszásakor: {e}")
-            self.is_playing = False
-
-
-    def stop_sound(self):
-        if self.is_playing:
-            self.stop_requested = True
-            logging.info("Hang lejátszás leállítási kérelem elküldve.")
-            # Nem hívjuk meg itt a stop() és unload() fv-t,
-            # mert a lejátszó szál felelős ezek végrehajtásáért.
-            # Ehelyett várunk, hogy a szál befejeződjön.
-            if self.player_thread and self.player_thread.is_alive():
-                self.player_thread.join(timeout=1) # Max 1 mp-et várunk
-                if self.player_thread.is_alive():
-                    logging.warning("Lejátszó szál nem állt le időben.")
-            self.is_playing = False
-            self.current_sound_file = None
-            logging.info("Hang lejátszás leállítva.")
-            wx.CallAfter(self.main_frame.show_status_message, "Csengetés leállítva.")
+            logging.error(f"Hiba a csengetési napló mentésekor: {e}")
+
+    def _prune(self, now):
+        cutoff = now - self.retention
+        for key in [key for key in self.entries if key[1] < cutoff]:
+            del self.entries[key]
+
+    def claim(self, bell_id, occurrence):
+        # True, ha az előfordulás még nem szólt; ekkor a memóriában azonnal rögzítjük, a lemezre a háttérben írjuk
+        key = (bell_id, int(occurrence.timestamp()))
+        with self.lock:
+            if key in self.entries:
+                return False
+            now = time.time()
+            self.entries[key] = now
+            self._prune(now)
+        self.writer.request()
+        return True
+
+    def flush(self):
+        self.writer.flush()
+
 
 class BellChecker:
     def __init__(self, main_frame, bell_player, bell_schedule_manager, settings_manager):
@@ -1456,18 +2526,38 @@ class BellChecker:
         self.settings_manager = settings_manager
         self.timer = wx.Timer(main_frame)
         self.check_interval = self.settings_manager.get_setting('check_interval', 5.0)
+        self.catchup_window = self.settings_manager.get_setting('catchup_window', 60.0)
+        self.preroll_seconds = self.settings_manager.get_setting('preroll_seconds', 5.0)
+        # Pre-roll: a következő esedékesség előkészített hangjai (csengetés id -> PreparedSound)
+        self.staged_due = None
+        self.staged_sounds = {}
         self.is_running = False
         self.thread = None
         self.stop_event = threading.Event()
+        # Ébresztő esemény: leállítás vagy ütemezés változás esetén azonnal felkelti a szálat
+        self.wake_event = threading.Event()
+        self.snapshot_version = None # A legutóbb feldolgozott ütemezés pillanatkép verziója
+        # Az ennél korábbi percek előfordulásai már fel vannak dolgozva
+        self.cursor = None
+        # Minden előfordulás pontosan egyszer szól, újraindítás után is
+        self.fire_ledger = FireLedger()
+        self.clock = WallClockAnchor()
+        # Esedékesség -> ébredés késés (a lejátszásig tartó késést a BellPlayer méri)
+        self.wake_latency = LatencyHistogram()
+        self.catchup_rings = 0 # Késve pótolt csengetések; ezek a késés hisztogramokba nem kerülnek
+        self.bell_schedule_manager.add_listener(self.on_schedule_changed)
 
     def start_checking(self):
         if self.is_running:
             return
 
         self.stop_event.clear()
+        self.wake_event.clear()
+        self.snapshot_version = None
         self.thread = threading.Thread(target=self._check_bells_thread, daemon=True)
         self.thread.start()
         self.is_running = True
+        self.prewarm_sounds()
         logging.info(f"Időzítő elindítva, ellenőrzési intervallum: {self.check_interval} másodperc.")
         logging.info("Ébresztő ellenőrző szál elindítva.")
 
@@ -1476,63 +2566,187 @@ class BellChecker:
             return
 
         self.stop_event.set()
+        self.wake_event.set()
         logging.info("Ébresztő ellenőrző szál leállítási kérelem elküldve.")
         if self.thread and self.thread.is_alive():
             self.thread.join(timeout=self.check_interval + 1) # Várjuk meg a szál leállását
             if self.thread.is_alive():
                 logging.warning("Ébresztő ellenőrző szál nem állt le időben.")
+        self.fire_ledger.flush()
+        logging.info(f"Időzítési statisztika: {json.dumps(self.get_stats())}")
         self.is_running = False
         logging.info("Ébresztő ellenőrző szál leállítva.")
 
+    def on_schedule_changed(self):
+        # A BellScheduleManager hívja; a következő esedékességet csak új pillanatképnél számoljuk újra
+        self.wake_event.set()
+        self.prewarm_sounds()
+
+    def prewarm_sounds(self):
+        bells = [bell for bell in self.bell_schedule_manager.snapshot.bells if bell.get('enabled', True)]
+        items = {(os.path.join('hangok', bell['sound_file']), bell_envelope(bell)) for bell in bells if bell.get('sound_file')}
+        self.bell_player.prewarm(list(items))
+        self.bell_player.prewarm_tones([(bell['tone'], bell_envelope(bell)) for bell in bells
+                                        if bell.get('tone') and not bell.get('sound_file')])
+
+    @staticmethod
+    def _minute_floor(moment):
+        return moment.replace(second=0, microsecond=0)
+
+    @staticmethod
+    def _next_due(snapshot, start):
+        # A következő foglalt perc a hét-perc indexből: (esedékesség, hét-perc) vagy None
+        start_minute = minute_of_week(start)
+        minute = snapshot.next_minute(start_minute)
+        if minute is None:
+            return None
+        offset = (minute - start_minute) % MINUTES_PER_WEEK
+        return start + datetime.timedelta(minutes=offset), minute
 
     def _check_bells_thread(self):
+        if self.cursor is None:
+            self.cursor = self._minute_floor(datetime.datetime.now())
+
+        next_due = None
         while not self.stop_event.is_set():
-            now = datetime.datetime.now()
-            current_time_str = now.strftime("%H:%M")
-            current_weekday_index = now.weekday() # Hétfő=0, Vasárnap=6
-
-            # Frissítsük a bell_schedule-t minden ellenőrzés előtt,
-            # ha változott a fájl vagy a memória
-            bell_schedule_copy = copy.deepcopy(self.bell_schedule_manager.bell_schedule)
-
-            for bell in bell_schedule_copy:
-                bell_time = bell['time']
-                bell_weekdays = bell.get('weekdays', [])
-                bell_name = bell.get('name', 'Névtelen csengetés')
-                bell_sound_file = bell.get('sound_file')
-                bell_volume = bell.get('volume', 50)
-                bell_enabled = bell.get('enabled', True) # Alapértelmezett, hogy engedélyezve van
-
-                if not bell_enabled:
-                    continue # Kihagyjuk a letiltott csengetéseket
-
-                # Ellenőrizzük a napokat
-                if bell_weekdays and WEEKDAYS_HUNGARIAN[current_weekday_index] not in bell_weekdays:
+            wake = self.clock.check_wake()
+
+            # Hivatkozás a közzétett pillanatképre: nincs másolás és nincs zárolás
+            snapshot = self.bell_schedule_manager.snapshot
+            if wake:
+                # Ébredés / óraugrás után a kurzortól számolunk: a kimaradt előfordulás így azonnal
+                # a _catch_up-ba kerül, és vagy megszólal a türelmi időn belül, vagy most naplózódik elmaradtként
+                self.snapshot_version = snapshot.version
+                self.staged_due = None
+                next_due = self._next_due(snapshot, self.cursor)
+            elif snapshot.version != self.snapshot_version:
+                self.snapshot_version = snapshot.version
+                self.staged_due = None # A változás érintheti az előkészített hangokat is
+                next_due = self._next_due(snapshot, max(self.cursor, self._minute_floor(datetime.datetime.now())))
+
+            if next_due is None:
+                # Nincs engedélyezett csengetés: alszunk, amíg az ütemezés nem változik
+                self._sleep(self.check_interval)
+                continue
+
+            due, minute = next_due
+            due_timestamp = due.timestamp()
+            remaining = self.clock.seconds_until(due_timestamp)
+            if remaining > SPIN_THRESHOLD:
+                if remaining <= self.preroll_seconds and self.staged_due != due:
+                    self._stage_bells(snapshot, due, minute)
                     continue
+                # A pontosságot az index adja; az intervallum csak a falióra-ugrások miatti
+                # újraellenőrzés felső korlátja. Kicsit korábban ébredünk a durva OS időzítő miatt,
+                # illetve a pre-roll kezdetére.
+                if remaining > self.preroll_seconds:
+                    timeout = remaining - self.preroll_seconds
+                else:
+                    timeout = remaining - SPIN_THRESHOLD / 2
+                self._sleep(min(timeout, self.check_interval))
+                continue
+            if remaining > 0:
+                self._spin_until(due_timestamp)
+                continue
 
-                if current_time_str == bell_time:
-                    logging.info(f"Ébresztő szól: {bell_name} - {bell_time}")
-                    if bell_sound_file:
-                        full_sound_path = os.path.join('hangok', bell_sound_file) # Teljes elérési út
-                        self.bell_player.play_sound(full_sound_path, bell_volume)
-                    else:
-                        wx.CallAfter(self.main_frame.show_status_message, f"Ébresztő szól: {bell_name} - {bell_time} (Nincs hangfájl beállítva)")
-                    # Hogy ne szólaljon meg újra azonnal:
-                    time.sleep(61) # Vár egy percet, mielőtt újra ellenőriz
+            if not wake:
+                self.wake_latency.record(time.time() - due_timestamp)
+            self._catch_up(snapshot, datetime.datetime.now())
+            self.staged_due = None
+            self.staged_sounds = {}
+            next_due = self._next_due(snapshot, self.cursor)
+
+    def _stage_bells(self, snapshot, due, minute):
+        # Pre-roll: néhány másodperccel az esedékesség előtt betöltjük és beállítjuk a hangokat
+        self.staged_due = due
+        self.staged_sounds = {}
+        for bell in snapshot.bells_at(minute):
+            prepared = self.bell_player.prepare_bell(bell)
+            if prepared is not None:
+                self.staged_sounds[bell['id']] = prepared
+        logging.info(f"Pre-roll: {len(self.staged_sounds)} hang előkészítve ({due.strftime('%H:%M')}).")
+
+    def _catch_up(self, snapshot, now):
+        # Minden esedékes előfordulás a kurzor és most között, az indexből.
+        # Csak a legutolsó szól, és csak ha a késés a türelmi időn belül van; a többi elmaradtként naplózódik.
+        minute_count = int((self._minute_floor(now) - self.cursor).total_seconds() // 60) + 1
+        if minute_count <= 0:
+            return
+        offsets = snapshot.minutes_between(minute_of_week(self.cursor), minute_count)
+        if not offsets:
+            self.cursor = self._minute_floor(now) + datetime.timedelta(minutes=1)
+            return
 
-            self.stop_event.wait(self.check_interval) # Vár a beállított intervallumot, vagy amíg meg nem állítják
+        catchup_window = datetime.timedelta(seconds=self.catchup_window)
+        for offset in offsets:
+            due = self.cursor + datetime.timedelta(minutes=offset)
+            late = now - due
+            ring = offset == offsets[-1] and late <= catchup_window
+            for bell in snapshot.bells_at((minute_of_week(self.cursor) + offset) % MINUTES_PER_WEEK):
+                bell_label = f"{bell.get('name', 'Névtelen csengetés')} - {bell['time']}"
+                if not ring:
+                    logging.warning(f"Elmaradt csengetés ({late.total_seconds():.0f} mp késés), nem szólal meg: {bell_label}")
+                elif self.fire_ledger.claim(bell['id'], due):
+                    scheduled_time = due.timestamp()
+                    if late.total_seconds() >= 1:
+                        # A pótlás késése nem az időzítés pontatlansága, ezért nem torzítja a percentiliseket
+                        logging.info(f"Késve pótolt csengetés ({late.total_seconds():.0f} mp): {bell_label}")
+                        self.catchup_rings += 1
+                        scheduled_time = None
+                    prepared = self.staged_sounds.get(bell['id']) if self.staged_due == due else None
+                    self._ring_bell(bell, scheduled_time, prepared)
+                else:
+                    logging.info(f"Csengetés már megszólalt ebben a percben, kihagyva: {bell_label}")
+        self.cursor = self.cursor + datetime.timedelta(minutes=offsets[-1] + 1)
+
+    def _sleep(self, timeout):
+        self.clock.expect(timeout)
+        self.wake_event.wait(timeout)
+        self.wake_event.clear()
+
+    def _spin_until(self, wall_timestamp):
+        # Az utolsó néhány ezredmásodperc: rövid átengedéssel várunk, nem az OS időzítőjével
+        while self.clock.seconds_until(wall_timestamp) > 0 and not self.wake_event.is_set():
+            time.sleep(0)
+
+    def get_stats(self):
+        return {
+            'wake_latency': self.wake_latency.summary(),
+            'play_latency': self.bell_player.get_latency_stats(),
+            'alarm_latency': self.bell_player.get_alarm_latency_stats(),
+            'clock_jumps': self.clock.jump_count,
+            'suspend_wakes': self.clock.suspend_count,
+            'catchup_rings': self.catchup_rings,
+        }
+
+    def _ring_bell(self, bell, scheduled_time=None, prepared=None):
+        bell_time = bell['time']
+        bell_name = bell.get('name', 'Névtelen csengetés')
+
+        logging.info(f"Ébresztő szól: {bell_name} - {bell_time}")
+        bell_zone = bell.get('zone') or DEFAULT_ZONE
+        bell_priority = bell.get('priority', 0)
+        if prepared is None:
+            prepared = self.bell_player.prepare_bell(bell)
+        if prepared is not None:
+            self.bell_player.play_prepared(prepared, scheduled_time, bell_zone, bell_priority)
+        else:
+            wx.CallAfter(self.main_frame.show_status_message, f"Ébresztő szól: {bell_name} - {bell_time} (A hang nem játszható le)")
 
     def update_check_interval(self, new_interval):
+        # Az intervallum már csak a várakozás felső korlátja, a szálat elég felébreszteni
         self.check_interval = new_interval
-        if self.is_running:
-            self.stop_checking()
-            self.start_checking()
+        self.wake_event.set()
         logging.info(f"Időzítő ellenőrzési intervallum frissítve: {new_interval} másodperc.")
 
+    def update_catchup_window(self, new_window):
+        self.catchup_window = new_window
+        logging.info(f"Elmaradt csengetések türelmi ideje frissítve: {new_window} másodperc.")
+
 
 class BellScheduleDialog(wx.Dialog):
     def __init__(self, parent, bell_data=None, available_sounds=None):
-        super(BellScheduleDialog, self).__init__(parent, title="Csengetés hozzáadása", size=(400, 450))
+        super(BellScheduleDialog, self).__init__(parent, title="Csengetés hozzáadása", size=(460, 560))
 
         self.panel = wx.Panel(self)
         self.bell_data = bell_data if bell_data else {}
@@ -1563,6 +2777,15 @@ class BellScheduleDialog(wx.Dialog):
         volume_sizer.Add(self.volume_slider, 1, wx.EXPAND | wx.ALL, 5)
         main_sizer.Add(volume_sizer, 0, wx.EXPAND | wx.ALL, 5)
 
+        # Hang forrása: hangfájl vagy beépített hang
+        source_sizer = wx.BoxSizer(wx.HORIZONTAL)
+        source_sizer.Add(wx.StaticText(self.panel, label="Hang:"), 0, wx.ALIGN_CENTER_VERTICAL | wx.ALL, 5)
+        self.source_choice = wx.Choice(self.panel, choices=["Hangfájl"] + list(TONE_PRESETS))
+        self.source_choice.SetSelection(0 if self.available_sounds else 1)
+        self.source_choice.Bind(wx.EVT_CHOICE, self.on_source_change)
+        source_sizer.Add(self.source_choice, 1, wx.EXPAND | wx.ALL, 5)
+        main_sizer.Add(source_sizer, 0, wx.EXPAND | wx.ALL, 5)
+
         # Hangfájl
         sound_sizer = wx.BoxSizer(wx.HORIZONTAL)
         sound_sizer.Add(wx.StaticText(self.panel, label="Hangfájl:"), 0, wx.ALIGN_CENTER_VERTICAL | wx.ALL, 5)
@@ -1573,6 +2796,27 @@ class BellScheduleDialog(wx.Dialog):
         sound_sizer.Add(test_sound_btn, 0, wx.ALIGN_CENTER_VERTICAL | wx.LEFT, 5)
         main_sizer.Add(sound_sizer, 0, wx.EXPAND | wx.ALL, 5)
 
+        # Zóna és prioritás
+        zone_sizer = wx.BoxSizer(wx.HORIZONTAL)
+        zone_sizer.Add(wx.StaticText(self.panel, label="Zóna:"), 0, wx.ALIGN_CENTER_VERTICAL | wx.ALL, 5)
+        zones = list(parent.main_frame.settings_manager.get_setting('zones', {}).keys()) or [DEFAULT_ZONE]
+        self.zone_combo = wx.ComboBox(self.panel, value=self.bell_data.get('zone', DEFAULT_ZONE), choices=zones)
+        zone_sizer.Add(self.zone_combo, 1, wx.EXPAND | wx.ALL, 5)
+        zone_sizer.Add(wx.StaticText(self.panel, label="Prioritás:"), 0, wx.ALIGN_CENTER_VERTICAL | wx.ALL, 5)
+        self.priority_spin = wx.SpinCtrl(self.panel, min=0, max=10, initial=self.bell_data.get('priority', 0))
+        zone_sizer.Add(self.priority_spin, 0, wx.ALL, 5)
+        main_sizer.Add(zone_sizer, 0, wx.EXPAND | wx.ALL, 5)
+
+        # Felfutás, lecsengés és leállítási halkítás (mp)
+        envelope_sizer = wx.BoxSizer(wx.HORIZONTAL)
+        self.envelope_spins = {}
+        for key, label in (('attack', "Felfutás:"), ('release', "Lecsengés:"), ('ramp', "Leállítás:")):
+            envelope_sizer.Add(wx.StaticText(self.panel, label=label), 0, wx.ALIGN_CENTER_VERTICAL | wx.ALL, 5)
+            spin = wx.SpinCtrlDouble(self.panel, min=0.0, max=10.0, inc=0.1, initial=self.bell_data.get(key, 0.0))
+            envelope_sizer.Add(spin, 0, wx.ALL, 5)
+            self.envelope_spins[key] = spin
+        main_sizer.Add(envelope_sizer, 0, wx.EXPAND | wx.ALL, 5)
+
         # Napok kiválasztása
         days_label = wx.StaticText(self.panel, label="Napok:")
         main_sizer.Add(days_label, 0, wx.ALL, 5)
@@ -1603,20 +2847,43 @@ class BellScheduleDialog(wx.Dialog):
         else:
             if available_sounds:
                 self.sound_choice.SetSelection(0) # Válassza ki az első hangot alapértelmezettként
+        self.on_source_change(None)
+
+    def _uses_sound_file(self):
+        return self.source_choice.GetSelection() == 0
+
+    def _selected_tone(self):
+        # Szerkesztéskor az azonos típusú eredeti paraméterek megmaradnak
+        tone = dict(TONE_PRESETS[self.source_choice.GetStringSelection()])
+        original_tone = self.bell_data.get('tone')
+        if original_tone and original_tone.get('type') == tone['type']:
+            return dict(original_tone)
+        return tone
+
+    def on_source_change(self, event):
+        self.sound_choice.Enable(self._uses_sound_file())
 
 
     def _load_bell_data(self, bell_data):
         time_obj = datetime.datetime.strptime(bell_data['time'], "%H:%M").time()
-        self.time_picker.SetValue(wx.DateTime.FromTime(time_obj.hour, time_obj.minute, 0))
+        self.hour_choice.SetSelection(time_obj.hour)
+        self.minute_choice.SetSelection(time_obj.minute)
 
-        self.name_text.SetValue(bell_data.get('name', ''))
         self.volume_slider.SetValue(bell_data.get('volume', 50))
 
+        tone = bell_data.get('tone')
+        if tone and not bell_data.get('sound_file'):
+            preset = next((name for name, preset in TONE_PRESETS.items() if preset['type'] == tone.get('type')), None)
+            if preset is not None:
+                self.source_choice.SetStringSelection(preset)
+        else:
+            self.source_choice.SetSelection(0)
+
         try:
             index = self.sound_choice.FindString(bell_data.get('sound_file', ''))
             if index != wx.NOT_FOUND:
                 self.sound_choice.SetSelection(index)
-            else:
+            elif bell_data.get('sound_file'):
                 wx.MessageBox(f"A korábbi hangfájl ({bell_data['sound_file']}) nem található. Kérjük válasszon újat.", "Hiányzó hangfájl", wx.OK | wx.ICON_WARNING)
         except Exception as e:
             logging.error(f"Hiba a hangfájl kiválasztásakor a dialógusban: {e}")
@@ -1626,6 +2893,14 @@ class BellScheduleDialog(wx.Dialog):
             checkbox.SetValue(day in selected_weekdays)
 
     def on_test_sound(self, event):
+        bell_player = self.GetParent().main_frame.bell_player
+        if not self._uses_sound_file():
+            prepared = bell_player.prepare_tone(self._selected_tone(), self.volume_slider.GetValue(),
+                                                bell_envelope({key: spin.GetValue() for key, spin in self.envelope_spins.items()}))
+            if prepared is not None:
+                bell_player.play_prepared(prepared, zone=self.zone_combo.GetValue().strip() or DEFAULT_ZONE,
+                                          priority=self.priority_spin.GetValue())
+            return
         selected_sound_index = self.sound_choice.GetSelection()
         if selected_sound_index == wx.NOT_FOUND:
             wx.MessageBox("Kérjük válasszon hangfájlt a teszteléshez.", "Nincs kijelölés", wx.OK | wx.ICON_WARNING)
@@ -1636,7 +2911,10 @@ class BellScheduleDialog(wx.Dialog):
         # Használjuk a BellPlayer példányt a lejátszáshoz
         # Itt a self.GetParent() a BellSchedulePanel, annak a main_frame attribútuma a MainFrame
         # A BellPlayer pedig a MainFrame-hez tartozik.
-        self.GetParent().main_frame.bell_player.play_sound(full_sound_path, volume)
+        zone = self.zone_combo.GetValue().strip() or DEFAULT_ZONE
+        envelope = bell_envelope({key: spin.GetValue() for key, spin in self.envelope_spins.items()})
+        self.GetParent().main_frame.bell_player.play_sound(full_sound_path, volume, zone=zone, priority=self.priority_spin.GetValue(),
+                                                           envelope=envelope, ramp=self.envelope_spins['ramp'].GetValue())
 
     def GetBellData(self):
         # A validációt a Validate metódusban végezzük el
@@ -1645,7 +2923,12 @@ class BellScheduleDialog(wx.Dialog):
         time_str = f"{hour}:{minute}"
         name = time_str # Név helyett az időt használjuk
         volume = self.volume_slider.GetValue()
-        sound_file = self.sound_choice.GetString(self.sound_choice.GetSelection())
+        sound_file = ''
+        tone = None
+        if self._uses_sound_file():
+            sound_file = self.sound_choice.GetString(self.sound_choice.GetSelection())
+        else:
+            tone = self._selected_tone()
         selected_weekdays = [day for day, checkbox in self.day_checkboxes.items() if checkbox.GetValue()]
         # Megtartjuk az enabled állapotot, ha szerkesztésről van szó
         enabled = self.bell_data.get('enabled', True)
@@ -1653,15 +2936,21 @@ class BellScheduleDialog(wx.Dialog):
             'time': time_str,
             'name': time_str,
             'sound_file': sound_file,
+            'tone': tone,
             'volume': volume,
             'weekdays': selected_weekdays,
+            'zone': self.zone_combo.GetValue().strip() or DEFAULT_ZONE,
+            'priority': self.priority_spin.GetValue(),
+            'attack': self.envelope_spins['attack'].GetValue(),
+            'release': self.envelope_spins['release'].GetValue(),
+            'ramp': self.envelope_spins['ramp'].GetValue(),
             'enabled': enabled
         }
 
     # Hozzáadjuk ezt a metódust a dialógus bezárása előtt történő validációhoz
     def Validate(self):
-        if self.sound_choice.GetSelection() == wx.NOT_FOUND:
-            wx.MessageBox("Kérjük válasszon hangfájlt a csengetéshez.", "Hiányzó adat", wx.OK | wx.ICON_WARNING)
+        if self._uses_sound_file() and self.sound_choice.GetSelection() == wx.NOT_FOUND:
+            wx.MessageBox("Kérjük válasszon hangfájlt vagy beépített hangot a csengetéshez.", "Hiányzó adat", wx.OK | wx.ICON_WARNING)
             self.sound_choice.SetFocus() # Fókuszáljunk a problémás mezőre
             return False
         if not self.day_checkboxes or not any(cb.GetValue() for cb in self.day_checkboxes.values()):
@@ -1725,6 +3014,7 @@ class SettingsPanel(wx.Panel):
         self.settings_manager = settings_manager
         self.drive_manager = drive_manager
         self.main_frame = parent.main_frame
+        self.text_apply_call = None
 
         main_sizer = wx.BoxSizer(wx.VERTICAL)
         
@@ -1738,12 +3028,52 @@ class SettingsPanel(wx.Panel):
         interval_sizer.Add(self.interval_ctrl, 0, wx.ALL, 5)
         self.interval_ctrl.Bind(wx.EVT_TEXT, self.on_interval_change)
         settings_box.Add(interval_sizer, 0, wx.EXPAND | wx.ALL, 5)
+
+        # Elmaradt csengetések türelmi ideje (alvás, felfüggesztés, óraállítás után)
+        catchup_sizer = wx.BoxSizer(wx.HORIZONTAL)
+        catchup_sizer.Add(wx.StaticText(self, label="Késve pótlás határa (mp):"), 0, wx.ALIGN_CENTER_VERTICAL | wx.ALL, 5)
+        self.catchup_ctrl = wx.TextCtrl(self, value=str(self.settings_manager.get_setting('catchup_window', 60.0)), size=(50, -1))
+        catchup_sizer.Add(self.catchup_ctrl, 0, wx.ALL, 5)
+        self.catchup_ctrl.Bind(wx.EVT_TEXT, self.on_catchup_change)
+        settings_box.Add(catchup_sizer, 0, wx.EXPAND | wx.ALL, 5)
+
+        # Zónánkénti hangerő, a csengetés saját hangerejével szorzódik
+        zone_volume_sizer = wx.BoxSizer(wx.HORIZONTAL)
+        zone_volume_sizer.Add(wx.StaticText(self, label="Zóna hangereje:"), 0, wx.ALIGN_CENTER_VERTICAL | wx.ALL, 5)
+        self.zone_volume_choice = wx.Choice(self)
+        self.zone_volume_choice.Bind(wx.EVT_CHOICE, self.on_zone_volume_select)
+        zone_volume_sizer.Add(self.zone_volume_choice, 0, wx.ALIGN_CENTER_VERTICAL | wx.ALL, 5)
+        self.zone_volume_slider = wx.Slider(self, value=100, minValue=0, maxValue=100,
+                                            style=wx.SL_HORIZONTAL | wx.SL_LABELS)
+        self.zone_volume_slider.Bind(wx.EVT_SLIDER, self.on_zone_volume_change)
+        zone_volume_sizer.Add(self.zone_volume_slider, 1, wx.EXPAND | wx.ALL, 5)
+        settings_box.Add(zone_volume_sizer, 0, wx.EXPAND | wx.ALL, 5)
+        self.refresh_zone_choices()
         
         # Ducking kapcsoló hozzáadása
+        # Hangosság kiegyenlítése: a hangosabb fájlokat a célszintre halkítja (erősíteni nem tud)
+        self.loudness_checkbox = wx.CheckBox(self, label="Hangosság kiegyenlítése (a hangos fájlok halkítása)")
+        self.loudness_checkbox.SetValue(self.settings_manager.get_setting('loudness_normalization', False))
+        self.loudness_checkbox.Bind(wx.EVT_CHECKBOX, self.on_loudness_toggle)
+        settings_box.Add(self.loudness_checkbox, 0, wx.ALL, 5)
+
         self.ducker_checkbox = wx.CheckBox(self, label="Ducking engedélyezése")
         self.ducker_checkbox.SetValue(self.settings_manager.get_setting('ducking_enabled', False))
         self.ducker_checkbox.Bind(wx.EVT_CHECKBOX, self.on_ducking_toggle)
         settings_box.Add(self.ducker_checkbox, 0, wx.ALL, 5)
+        backend_sizer = wx.BoxSizer(wx.HORIZONTAL)
+        backend_sizer.Add(wx.StaticText(self, label="Ducking hangerő vezérlés:"), 0, wx.ALIGN_CENTER_VERTICAL | wx.ALL, 5)
+        self.ducker_backend_choice = wx.Choice(self, choices=DUCKING_BACKEND_CHOICES)
+        self.ducker_backend_choice.SetStringSelection(self.settings_manager.get_setting('ducking_backend', 'auto'))
+        self.ducker_backend_choice.Bind(wx.EVT_CHOICE, self.on_ducking_backend_change)
+        backend_sizer.Add(self.ducker_backend_choice, 0, wx.ALL, 5)
+        settings_box.Add(backend_sizer, 0, wx.EXPAND | wx.ALL, 5)
+        self.ducker_process_checkbox = wx.CheckBox(self, label="Ducking külön folyamatban (újraindításkor érvényes)")
+        self.ducker_process_checkbox.SetValue(self.settings_manager.get_setting('ducking_process', False))
+        self.ducker_process_checkbox.Bind(wx.EVT_CHECKBOX, self.on_ducking_process_toggle)
+        settings_box.Add(self.ducker_process_checkbox, 0, wx.ALL, 5)
+        self.ducker_status_label = wx.StaticText(self, label="Ducking: kikapcsolva")
+        settings_box.Add(self.ducker_status_label, 0, wx.ALL, 5)
 
         main_sizer.Add(settings_box, 0, wx.EXPAND | wx.ALL, 10)
 
@@ -1812,24 +3142,99 @@ class SettingsPanel(wx.Panel):
             self.Layout()
 
 
+    def refresh_zone_choices(self):
+        # A beállításokban szereplő és a csengetési rendben használt zónák
+        zones = set(self.settings_manager.get_setting('zones', {})) | {DEFAULT_ZONE}
+        zones.update(bell.get('zone') or DEFAULT_ZONE for bell in self.main_frame.schedule_manager.snapshot.bells)
+        selected = self.zone_volume_choice.GetStringSelection() or DEFAULT_ZONE
+        self.zone_volume_choice.Set(sorted(zones))
+        self.zone_volume_choice.SetStringSelection(selected)
+        self.on_zone_volume_select(None)
+
+    def on_zone_volume_select(self, event):
+        zone = self.zone_volume_choice.GetStringSelection()
+        zone_config = self.settings_manager.get_setting('zones', {}).get(zone, {})
+        self.zone_volume_slider.SetValue(zone_config.get('volume', 100))
+
+    def on_zone_volume_change(self, event):
+        zone = self.zone_volume_choice.GetStringSelection()
+        if not zone:
+            return
+        volume = self.zone_volume_slider.GetValue()
+        # Új szótár, hogy a mentés ne egy közben módosuló objektumot írjon ki
+        zones = {name: dict(config) for name, config in self.settings_manager.get_setting('zones', {}).items()}
+        zones.setdefault(zone, {})['volume'] = volume
+        self.settings_manager.set_setting('zones', zones)
+        self.main_frame.bell_player.set_zone_volume(zone, volume)
+
     def on_interval_change(self, event):
+        self._schedule_text_apply()
+
+    def on_catchup_change(self, event):
+        self._schedule_text_apply()
+
+    def _schedule_text_apply(self):
+        # Gépelés közben nem mentünk és nem konfigurálunk át; csak a szünet után, egyszer
+        if self.text_apply_call and self.text_apply_call.IsRunning():
+            self.text_apply_call.Restart(TEXT_APPLY_DELAY_MS)
+        else:
+            self.text_apply_call = wx.CallLater(TEXT_APPLY_DELAY_MS, self._apply_text_settings)
+
+    def flush_pending(self):
+        if self.text_apply_call and self.text_apply_call.IsRunning():
+            self.text_apply_call.Stop()
+            self._apply_text_settings()
+
+    def _apply_text_settings(self):
         try:
             new_interval = float(self.interval_ctrl.GetValue())
             if new_interval <= 0:
                 raise ValueError
-            self.settings_manager.set_setting('check_interval', new_interval)
-            self.main_frame.bell_checker.update_check_interval(new_interval)
+            if new_interval != self.settings_manager.get_setting('check_interval', 5.0):
+                self.settings_manager.set_setting('check_interval', new_interval)
+                self.main_frame.bell_checker.update_check_interval(new_interval)
         except ValueError:
             logging.error("Hibás ellenőrzési időköz formátum.")
             self.main_frame.show_status_message("Hiba: Az ellenőrzési időköznek egy pozitív számnak kell lennie.")
+        try:
+            new_window = float(self.catchup_ctrl.GetValue())
+            if new_window < 0:
+                raise ValueError
+            if new_window != self.settings_manager.get_setting('catchup_window', 60.0):
+                self.settings_manager.set_setting('catchup_window', new_window)
+                self.main_frame.bell_checker.update_catchup_window(new_window)
+        except ValueError:
+            logging.error("Hibás késve pótlási határ formátum.")
+            self.main_frame.show_status_message("Hiba: A késve pótlás határának nemnegatív számnak kell lennie.")
 
 
+    def on_loudness_toggle(self, event):
+        enabled = self.loudness_checkbox.GetValue()
+        self.settings_manager.set_setting('loudness_normalization', enabled)
+        if enabled:
+            # Az ütemezett hangok mérése most a háttérben, ne az első csengetéskor
+            self.main_frame.bell_checker.prewarm_sounds()
+        self.main_frame.show_status_message(f"Hangosság kiegyenlítése {'bekapcsolva' if enabled else 'kikapcsolva'}.")
+
     def on_ducking_toggle(self, event):
         enabled = self.ducker_checkbox.GetValue()
         self.settings_manager.set_setting('ducking_enabled', enabled)
         self.main_frame.show_status_message(f"Ducking {'engedélyezve' if enabled else 'letiltva'}.")
         self.main_frame._toggle_ducker(enabled)
 
+    def on_ducking_backend_change(self, event):
+        # Újraindításkor (vagy a ducking ki-be kapcsolásakor) érvényes
+        self.settings_manager.set_setting('ducking_backend', self.ducker_backend_choice.GetStringSelection())
+
+    def on_ducking_process_toggle(self, event):
+        self.settings_manager.set_setting('ducking_process', self.ducker_process_checkbox.GetValue())
+
+    def update_ducker_status(self, ducker):
+        if ducker is None:
+            self.ducker_status_label.SetLabel("Ducking: kikapcsolva")
+        else:
+            self.ducker_status_label.SetLabel(f"Ducking: {round(ducker.level * 100)}% ({'beszéd' if ducker.speech else 'csend'})")
+
     def on_login_drive(self, event):
         self.drive_manager.authenticate_google_drive()
 
@@ -1899,9 +3304,16 @@ class MainFrame(wx.Frame):
         self.drive_manager = GoogleDriveManager(self)
         self.bell_player = BellPlayer(self)
         self.bell_checker = BellChecker(self, self.bell_player, self.schedule_manager, self.settings_manager)
+        self.alarm_server = AlarmServer(self, self.settings_manager.get_setting('alarm_port', ALARM_PORT))
 
         # UI elemek
         self.panel = wx.Panel(self)
+
+        # Vészjelzés gomb, mindig látható
+        self.alarm_button = wx.ToggleButton(self.panel, label="VÉSZJELZÉS")
+        self.alarm_button.SetBackgroundColour(wx.Colour(200, 0, 0))
+        self.alarm_button.SetForegroundColour(wx.WHITE)
+        self.alarm_button.Bind(wx.EVT_TOGGLEBUTTON, self.on_alarm_toggle)
         self.notebook = wx.Notebook(self.panel)
         
         # Oldalak hozzáadása a jegyzethez
@@ -1928,6 +3340,7 @@ class MainFrame(wx.Frame):
         
         # Fő Sizer
         main_sizer = wx.BoxSizer(wx.VERTICAL)
+        main_sizer.Add(self.alarm_button, 0, wx.EXPAND | wx.ALL, 5)
         main_sizer.Add(self.notebook, 1, wx.EXPAND | wx.ALL, 5)
         self.panel.SetSizer(main_sizer)
         
@@ -1938,25 +3351,63 @@ class MainFrame(wx.Frame):
         
         # Ducking inicializálás
         self.ducker = None
+        self.ducker_timer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, self.on_ducker_timer, self.ducker_timer)
         self._toggle_ducker(self.settings_manager.get_setting('ducking_enabled', False))
         
         # Indítsuk el a csengetés ellenőrzést
         self.bell_checker.start_checking()
+        self.alarm_server.start()
+
+        # Indítási idő jelentés az első kirajzoláskor
+        self.first_paint_reported = False
+        self.panel.Bind(wx.EVT_PAINT, self.on_first_paint)
 
 
     def show_status_message(self, message):
+        if not self:
+            return # Bezárás után érkező CallAfter (pl. a kilépéskori mentésből)
         self.statusbar.SetStatusText(message)
 
+    def on_first_paint(self, event):
+        event.Skip()
+        if self.first_paint_reported:
+            return
+        self.first_paint_reported = True
+        self.panel.Unbind(wx.EVT_PAINT)
+        first_paint = time.perf_counter() - STARTUP_STARTED
+        logging.info(f"Indítási idők: importok {IMPORT_TIMES}, első kirajzolás {first_paint:.2f} mp")
+
+    def on_alarm_toggle(self, event):
+        if self.alarm_button.GetValue():
+            self.bell_player.trigger_alarm()
+        else:
+            self.bell_player.stop_alarm()
+        self.on_alarm_state_changed()
+
+    def on_alarm_state_changed(self):
+        self.alarm_button.SetValue(self.bell_player.alarm_active)
+        self.alarm_button.SetLabel("VÉSZJELZÉS LEÁLLÍTÁSA" if self.bell_player.alarm_active else "VÉSZJELZÉS")
+
 
     def load_bell_schedule(self):
-        self.schedule_manager.load_bell_schedule()
+        self.schedule_manager.reload_bell_schedule()
         self.schedule_panel.refresh_schedule_list()
 
 
     def load_settings(self):
-        self.settings_manager.load_settings()
-        # Frissítjük a UI elemeket az új beállításokkal
-        self.settings_panel.interval_ctrl.SetValue(str(self.settings_manager.get_setting('check_interval', 5.0)))
+        self.settings_manager.reload_settings()
+        # Frissítjük a UI elemeket az új beállításokkal; a ChangeValue nem vált ki EVT_TEXT-et (és így újabb mentést)
+        check_interval = self.settings_manager.get_setting('check_interval', 5.0)
+        catchup_window = self.settings_manager.get_setting('catchup_window', 60.0)
+        self.settings_panel.interval_ctrl.ChangeValue(str(check_interval))
+        self.settings_panel.catchup_ctrl.ChangeValue(str(catchup_window))
+        self.settings_panel.loudness_checkbox.SetValue(self.settings_manager.get_setting('loudness_normalization', False))
+        self.bell_checker.update_check_interval(check_interval)
+        self.bell_checker.update_catchup_window(catchup_window)
+        for zone, config in self.settings_manager.get_setting('zones', {}).items():
+            self.bell_player.set_zone_volume(zone, config.get('volume', 100))
+        self.settings_panel.refresh_zone_choices()
         self.show_status_message("Beállítások betöltve.")
 
 
@@ -1975,33 +3426,63 @@ class MainFrame(wx.Frame):
             logging.info(f"Fül váltva jobbra: {new_page_text}")
         elif new_page < old_page:
             logging.info(f"Fül váltva balra: {new_page_text}")
+        if self.notebook.GetPage(new_page) is self.settings_panel:
+            # Az ütemezésben időközben felvett zónák is jelenjenek meg
+            self.settings_panel.refresh_zone_choices()
         event.Skip()
 
 
     def on_close(self, event):
         try:
             if hasattr(self, 'ducker') and self.ducker:
+                self.ducker_timer.Stop()
                 self.ducker.stop()
                 logging.info('DuckerVAD leállítva a kilépéskor (hangerő visszaállítva).')
         except Exception:
             logging.exception('DuckerVAD leállítási hiba kilépéskor.')
         logging.info("Alkalmazás bezárása.")
-        self.bell_player.stop_sound()
+        # Függő (késleltetett) mentések kiírása
+        self.settings_panel.flush_pending()
+        self.settings_manager.flush()
+        self.schedule_manager.flush()
+        self.alarm_server.stop()
+        self.bell_player.shutdown()
         self.bell_checker.stop_checking()
         self.Destroy()
 
+    def on_ducker_timer(self, event):
+        self.settings_panel.update_ducker_status(self.ducker)
+
     def _toggle_ducker(self, enabled):
         if enabled:
             if not self.ducker:
-                self.ducker = AdaptiveVoiceDuckerVAD()
-                self.ducker.start()
+                backend_name = self.settings_manager.get_setting('ducking_backend', 'auto')
+                try:
+                    if backend_name == 'mixer':
+                        # A keverő ebben a folyamatban van, ezért ilyenkor a ducker sem futhat külön folyamatban
+                        if self.settings_manager.get_setting('ducking_process', False):
+                            logging.warning("Keverő szintű ducking: a ducker a fő folyamatban fut.")
+                        ducker = AdaptiveVoiceDuckerVAD(backend=MixerVolumeBackend(self.bell_player))
+                    elif self.settings_manager.get_setting('ducking_process', False):
+                        ducker = DuckerProcess(backend_name)
+                    else:
+                        ducker = AdaptiveVoiceDuckerVAD(backend=create_volume_backend(backend_name))
+                    ducker.start()
+                except Exception as e:
+                    logging.exception("DuckerVAD indítási hiba.")
+                    self.show_status_message(f"Hiba a ducking indításakor: {e}")
+                    return
+                self.ducker = ducker
+                self.ducker_timer.Start(250)
                 logging.info("DuckerVAD elindítva.")
             else:
                 logging.info("DuckerVAD már fut, nem indítjuk újra.")
         else:
             if self.ducker:
+                self.ducker_timer.Stop()
                 self.ducker.stop()
                 self.ducker = None
+                self.settings_panel.update_ducker_status(None)
                 logging.info("DuckerVAD leállítva.")
             else:
                 logging.info("DuckerVAD már le van állítva.")
@@ -2030,6 +3511,7 @@ class BellSchedulePanel(wx.Panel):
         self.schedule_list.InsertColumn(3, 'Nap(ok)', width=120)
         self.schedule_list.InsertColumn(4, 'Név', width=150)
         self.schedule_list.InsertColumn(5, 'Engedélyezve', width=100)
+        self.schedule_list.InsertColumn(6, 'Zóna', width=100)
         main_sizer.Add(self.schedule_list, 1, wx.EXPAND | wx.ALL, 10)
 
         # Gombok
@@ -2067,19 +3549,23 @@ class BellSchedulePanel(wx.Panel):
     def refresh_schedule_list(self):
         self.schedule_list.DeleteAllItems()
         selected_day = self.day_choice.GetStringSelection()
-        bells = self.main_frame.schedule_manager.get_bells_for_day(selected_day)
+        # Egyetlen pillanatképből dolgozunk, így az indexek biztosan egyeznek
+        bells = self.main_frame.schedule_manager.snapshot.bells
+        rows = [(original_index, bell) for original_index, bell in enumerate(bells)
+                if selected_day == "Összes nap" or selected_day in bell.get('weekdays', ())]
         
-        for i, bell in enumerate(bells):
+        for i, (original_index, bell) in enumerate(rows):
             index = self.schedule_list.InsertItem(i, bell['time'])
             self.schedule_list.SetItem(index, 1, str(bell['volume']))
-            self.schedule_list.SetItem(index, 2, bell['sound_file'])
+            self.schedule_list.SetItem(index, 2, bell.get('sound_file') or f"[{(bell.get('tone') or FALLBACK_TONE).get('type')}]")
             self.schedule_list.SetItem(index, 3, ", ".join(bell['weekdays']))
             self.schedule_list.SetItem(index, 4, bell.get('name', 'Névtelen csengetés'))
             enabled_text = "Igen" if bell.get('enabled', True) else "Nem"
             self.schedule_list.SetItem(index, 5, enabled_text)
+            self.schedule_list.SetItem(index, 6, f"{bell.get('zone', DEFAULT_ZONE)} ({bell.get('priority', 0)})")
             
             # Index hozzárendelése az eredeti listához, mert a filterezés miatt eltérhet a listCtrl indexétől
-            self.schedule_list.SetItemData(index, self.main_frame.schedule_manager.bell_schedule.index(bell))
+            self.schedule_list.SetItemData(index, original_index)
             
             # Színezés, ha le van tiltva
             if not bell.get('enabled', True):
@@ -2090,10 +3576,8 @@ class BellSchedulePanel(wx.Panel):
         self.refresh_schedule_list()
 
     def on_add_bell(self, event):
+        # Hangfájlok nélkül is felvehető csengetés beépített hanggal
         available_sounds = self.get_available_sound_files()
-        if not available_sounds:
-            wx.MessageBox("Nincs hangfájl a 'hangok' mappában. Kérjük másoljon be hangokat.", "Hiányzó hangfájlok", wx.OK | wx.ICON_WARNING)
-            return
 
         with BellScheduleDialog(self, available_sounds=available_sounds) as dlg:
             if dlg.ShowModal() == wx.ID_OK:
@@ -2114,7 +3598,7 @@ class BellSchedulePanel(wx.Panel):
         bell_data = self.main_frame.schedule_manager.get_bell_by_index(original_index)
         available_sounds = self.get_available_sound_files()
 
-        if bell_data and available_sounds:
+        if bell_data:
             with BellScheduleDialog(self, bell_data, available_sounds) as dlg:
                 if dlg.ShowModal() == wx.ID_OK:
                     if dlg.Validate():
@@ -2123,7 +3607,7 @@ class BellSchedulePanel(wx.Panel):
                         self.refresh_schedule_list()
                         self.main_frame.show_status_message("Csengetés frissítve.")
         else:
-            wx.MessageBox("Nem sikerült betölteni a csengetés adatait vagy nincsenek elérhető hangok.", "Hiba", wx.OK | wx.ICON_ERROR)
+            wx.MessageBox("Nem sikerült betölteni a csengetés adatait.", "Hiba", wx.OK | wx.ICON_ERROR)
 
 
     def on_delete_bell(self, event):
@@ -2187,6 +3671,23 @@ class BellSchedulePanel(wx.Panel):
 
 # --- Az alkalmazás indítása ---
 if __name__ == '__main__':
+    multiprocessing.freeze_support() # A külön folyamatú ducker csomagolt (exe) futtatáshoz
+    # Ducker hangolás felvételen: --ducker-replay felvetel.wav [trajektoria.csv] [attack=0.3 release=0.95 vad_level=3 ...]
+    if len(sys.argv) > 2 and sys.argv[1] == '--ducker-replay':
+        options = dict(arg.split('=', 1) for arg in sys.argv[3:] if '=' in arg)
+        options = {key: int(value) if key in ('vad_level', 'ring_frames') else float(value) for key, value in options.items()}
+        outputs = [arg for arg in sys.argv[3:] if '=' not in arg]
+        print(json.dumps(replay_ducker(sys.argv[2], outputs[0] if outputs else None, **options), indent=4))
+        sys.exit(0)
+    # Parancssori vészjelzés vezérlés a futó példánynak: --alarm, --alarm-stop, --alarm-status
+    alarm_commands = {'--alarm': 'ALARM', '--alarm-stop': 'STOP', '--alarm-status': 'STATUS'}
+    if len(sys.argv) > 1 and sys.argv[1] in alarm_commands:
+        try:
+            print(send_alarm_command(alarm_commands[sys.argv[1]], SettingsManager(None).get_setting('alarm_port', ALARM_PORT)))
+        except OSError as e:
+            print(f"A futó Vekker nem érhető el: {e}")
+            sys.exit(1)
+        sys.exit(0)
     app = wx.App()
     frame = MainFrame(None, title="Vekker")
     frame.Show()